@@ -20,6 +20,17 @@ class Agent(ABC):
     def game(self):
         return self.player.game
 
+    def ponder(self):
+        """
+        Called when it is a human's turn, in case the agent wants to think in the background
+        Whatever it starts must stop by the time choose_action is called, or game_over is
+        """
+
+    def game_over(self):
+        """
+        Called once the game is finished
+        """
+
     @abstractmethod
     def choose_action(self):
         """
@@ -0,0 +1,91 @@
+"""
+Evaluation Cache
+
+The standard board never changes, so the same positions come up over and over (especially during setup).
+Remember what the net said about a position so we don't have to ask it again.
+"""
+
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+from catan2 import config
+
+# Rough cost of an entry beyond its priors tensor: the key, the OrderedDict slot, the tuple and the float
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class EvalCache:
+    """
+    Bounded LRU map of state key -> (masked priors, value)
+
+    Entries belong to one version of the net. Asking with a different version empties the cache.
+    """
+
+    def __init__(self, max_entries: int = None, max_mb: float = None):
+        self.max_entries = max_entries or config['ai']['zero']['cache']['max_entries']
+        self.max_bytes = (max_mb or config['ai']['zero']['cache']['max_mb']) * 1024 * 1024
+
+        self.version = None
+        self.bytes = 0
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(state, legal_action_ids):
+        h = hashlib.blake2b(state.cpu().numpy().tobytes(), digest_size=16)
+        h.update(np.asarray(legal_action_ids, dtype=np.int16).tobytes())
+        return h.digest()
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def get(self, key, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, priors, value):
+        if key in self._entries:
+            return
+
+        self._entries[key] = (priors, value)
+        self.bytes += self.sizeof(priors)
+
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (old_priors, _) = self._entries.popitem(last=False)
+            self.bytes -= self.sizeof(old_priors)
+            self.evictions += 1
+
+    @staticmethod
+    def sizeof(priors):
+        return priors.element_size() * priors.nelement() + ENTRY_OVERHEAD_BYTES
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'mb': self.bytes / (1024 * 1024),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0
+        }
@@ -11,6 +11,7 @@ from torch import nn, optim
 from catan2 import config
 from catan2.constants import BOARD_WIDTH, NUM_UNIQUE_ACTIONS
 
+from .cache import EvalCache
 from .device import device
 from .gamestate import GameState
 
@@ -18,10 +19,9 @@ NUM_GAME_LAYERS = sum(v for k, v in GameState.num_layers.items())
 
 
 class ConvBlock(nn.Module):
-    out_channels = 32
-
-    def __init__(self):
+    def __init__(self, out_channels: int):
         super().__init__()
+        self.out_channels = out_channels
 
         self.conv1 = nn.Conv2d(in_channels=NUM_GAME_LAYERS, out_channels=self.out_channels, kernel_size=5, stride=1, padding=2)
         self.bn1 = nn.BatchNorm2d(self.out_channels)
@@ -35,12 +35,9 @@ class ConvBlock(nn.Module):
 
 
 class ResBlock(nn.Module):
-    in_planes = ConvBlock.out_channels
-    planes = in_planes
-    out_planes = planes
-
-    def __init__(self):
+    def __init__(self, planes: int):
         super().__init__()
+        self.in_planes = self.planes = self.out_planes = planes
 
         self.layer1 = nn.Sequential(
             nn.Conv2d(self.in_planes, self.planes, kernel_size=5, stride=1, padding=2, bias=False),
@@ -63,12 +60,12 @@ class ResBlock(nn.Module):
 
 
 class OutBlock(nn.Module):
-    in_planes = ResBlock.out_planes
     bn_planes = 3
-    v_fc_size = p_fc_size = int(in_planes / 2)
 
-    def __init__(self):
+    def __init__(self, in_planes: int):
         super().__init__()
+        self.in_planes = in_planes
+        self.v_fc_size = self.p_fc_size = int(in_planes / 2)
 
         # value
         self.v_conv = nn.Conv2d(self.in_planes, self.bn_planes, kernel_size=1)
@@ -130,17 +127,23 @@ class AlphaLoss(nn.Module):
 
 
 class CNN(nn.Module):
-    def __init__(self):
+    def __init__(self, channels: int = None, res_layers: int = None):
         super().__init__()
+        self.channels = channels or config['ai']['zero']['net']['channels']
+        self.res_layers = res_layers if res_layers is not None else config['ai']['zero']['net']['res_layers']
 
         # Build the net
-        self.conv = ConvBlock()
-        for block in range(config['ai']['zero']['net']['res_layers']):
-            setattr(self, "res_%i" % block, ResBlock())
-        self.outblock = OutBlock()
+        self.conv = ConvBlock(self.channels)
+        for block in range(self.res_layers):
+            setattr(self, "res_%i" % block, ResBlock(self.channels))
+        self.outblock = OutBlock(self.channels)
 
         self.criterion = AlphaLoss()
 
+        # Bumped every time the weights change, so cached evaluations can be thrown out
+        self.version = 0
+        self.cache = EvalCache() if config['ai']['zero']['cache']['enabled'] else None
+
         # Optimize
         self.set_optimizer()
         self.set_scheduler()
@@ -216,7 +219,7 @@ class CNN(nn.Module):
 
     def forward(self, s):
         s = self.conv(s)
-        for block in range(config['ai']['zero']['net']['res_layers']):
+        for block in range(self.res_layers):
             s = getattr(self, "res_%i" % block)(s)
         s = self.outblock(s)
 
@@ -226,6 +229,7 @@ class CNN(nn.Module):
         filename = filename or self.get_path(net_version)
         self.load_state_dict(torch.load(filename))
         self.to(device)
+        self.version += 1
 
     def save(self, net_version: int = None, filename: str = None):
         filename = filename or self.get_path(net_version)
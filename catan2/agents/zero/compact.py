@@ -0,0 +1,67 @@
+"""
+Compact Samples
+
+How a cooked sample is stored, in memory and on disk:
+    state           uint8 planes - every layer is a small count
+    policy_ids      int16, the actions with any visits
+    policy_probs    float16, their share of the visits
+    value           int8, +1 or -1
+About 1 byte per cell, plus 4 bytes per visited action. A dense sample (int64 planes, 207 floats) is ~7 KB.
+Loaders decode back to what training expects: (int64 state, 207 float pi, short value), on the CPU.
+Decoding happens in DataLoader workers, which mustn't touch the GPU, so the train loop moves each batch to the device.
+"""
+
+import io
+
+import torch
+
+from catan2.constants import NUM_UNIQUE_ACTIONS
+
+
+def encode(state, pi, value):
+    pi = torch.as_tensor(pi, dtype=torch.float)
+    policy_ids = torch.nonzero(pi).view(-1)
+
+    return (
+        state.cpu().to(torch.uint8),
+        policy_ids.to(torch.int16),
+        pi[policy_ids].to(torch.float16),
+        torch.as_tensor(value, dtype=torch.int8)
+    )
+
+
+def as_compact(sample):
+    """
+    Older dense samples, (state, pi, v), get encoded. Compact ones pass straight thru
+    """
+    return encode(*sample) if len(sample) == 3 else sample
+
+
+def decode(sample):
+    """
+    A compact sample as training wants it. Older dense samples, (state, pi, v), pass straight thru
+    """
+    if len(sample) == 3:
+        return sample
+
+    state, policy_ids, policy_probs, value = sample
+    pi = torch.zeros(NUM_UNIQUE_ACTIONS)
+    pi[policy_ids.long()] = policy_probs.float()
+
+    return state.long(), pi, value.short()
+
+
+def nbytes(sample):
+    """
+    Bytes held by a sample's tensors
+    """
+    return sum(t.element_size() * t.nelement() for t in sample)
+
+
+def pickled_nbytes(samples):
+    """
+    Bytes per sample for a list of samples written with torch.save, the way cook_samples writes a game
+    """
+    buffer = io.BytesIO()
+    torch.save(samples, buffer)
+    return buffer.getbuffer().nbytes / len(samples)
@@ -0,0 +1,148 @@
+"""
+Compiled Inference
+
+A frozen copy of the CNN just for search: eval mode, BatchNorm folded into the convolutions,
+the res blocks unrolled, and the whole thing traced with TorchScript.
+It has to be rebuilt whenever the CNN's weights change.
+
+The policy head can be left out of the traced graph, so that only the rows of p_fc for legal moves get computed.
+A typical position has a few dozen legal moves out of 207.
+
+Self-play can go one step further with an int8 copy. Dynamic quantization only covers the Linear layers,
+which is where most of the weights are (the policy head alone is ~80% of them).
+So a quantized copy always keeps p_fc in the traced graph - sparse_policy would leave the policy head in float.
+"""
+
+import copy
+
+import torch
+from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from catan2 import config
+from catan2.constants import BOARD_WIDTH
+
+from .cache import EvalCache
+from .cnn import CNN, NUM_GAME_LAYERS
+
+
+class InferenceCNN(nn.Module):
+    """
+    Same math as CNN.forward in eval mode, without the BatchNorms or any config lookups
+    With sparse_policy, forward stops short of p_fc and returns the policy features instead of the priors
+    """
+
+    def __init__(self, net: CNN, sparse_policy: bool = False):
+        super().__init__()
+        net = copy.deepcopy(net).cpu().eval()
+        self.sparse_policy = sparse_policy
+
+        self.conv = fuse_conv_bn_eval(net.conv.conv1, net.conv.bn1)
+        self.res = nn.ModuleList([
+            nn.ModuleList([
+                fuse_conv_bn_eval(block.layer1[0], block.layer1[1]),
+                fuse_conv_bn_eval(block.layer2[0], block.layer2[1])
+            ])
+            for block in (getattr(net, "res_%i" % i) for i in range(net.res_layers))
+        ])
+
+        out = net.outblock
+        self.v_conv = fuse_conv_bn_eval(out.v_conv, out.v_bn)
+        self.v_fc1 = out.v_fc1
+        self.v_fc2 = out.v_fc2
+        self.p_conv = fuse_conv_bn_eval(out.p_conv, out.p_bn)
+        self.p_fc = out.p_fc
+
+    def forward(self, s):
+        s = s.view(-1, NUM_GAME_LAYERS, BOARD_WIDTH, BOARD_WIDTH).float()
+        s = torch.relu(self.conv(s))
+
+        for layer1, layer2 in self.res:
+            s = torch.relu(layer2(torch.relu(layer1(s))) + s)
+
+        v = torch.relu(self.v_conv(s)).flatten(1)
+        v = torch.tanh(self.v_fc2(torch.relu(self.v_fc1(v))))
+
+        p = torch.relu(self.p_conv(s)).flatten(1)
+        if not self.sparse_policy:
+            p = torch.softmax(self.p_fc(p), dim=1)
+
+        return p, v
+
+
+class CompiledNet:
+    """
+    Call it like a net: compiled(state) -> (priors, value)
+    Shares the CNN's cache and version, since it gives the same answers as the CNN in eval mode
+    A quantized copy gives slightly different answers, so it keeps a cache of its own
+    """
+
+    def __init__(self, net: CNN, quantize: bool = False, sparse_policy: bool = None):
+        compiled_config = config['ai']['zero']['compiled']
+        if compiled_config['threads']:
+            torch.set_num_threads(compiled_config['threads'])
+        self.channels_last = compiled_config['channels_last']
+
+        self.net = net
+        self.version = net.version
+        self.quantize = quantize
+        self._cache = EvalCache() if quantize and config['ai']['zero']['cache']['enabled'] else None
+
+        if sparse_policy is None:
+            sparse_policy = compiled_config['sparse_policy'] and not quantize
+        if quantize and sparse_policy:
+            raise Exception('A quantized net keeps its policy head in the graph, so it can\'t have a sparse policy')
+        self.sparse_policy = sparse_policy
+        model = InferenceCNN(net, self.sparse_policy).eval()
+        if self.sparse_policy:
+            self.p_weight = model.p_fc.weight.detach().clone()
+            self.p_bias = model.p_fc.bias.detach().clone()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        example = torch.zeros(1, NUM_GAME_LAYERS, BOARD_WIDTH, BOARD_WIDTH)
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+            example = example.to(memory_format=torch.channels_last)
+
+        with torch.no_grad():
+            self.model = torch.jit.freeze(torch.jit.trace(model, example))
+
+    @property
+    def cache(self):
+        return self._cache if self.quantize else self.net.cache
+
+    def prepare(self, state):
+        state = state.cpu().view(-1, NUM_GAME_LAYERS, BOARD_WIDTH, BOARD_WIDTH).float()
+        if self.channels_last:
+            state = state.contiguous(memory_format=torch.channels_last)
+
+        return state
+
+    def __call__(self, state):
+        with torch.inference_mode():
+            p, v = self.model(self.prepare(state))
+            if self.sparse_policy:
+                p = torch.softmax(torch.addmm(self.p_bias, p, self.p_weight.t()), dim=1)
+
+            return p, v
+
+    def legal_priors(self, state, legal_action_ids):
+        """
+        Priors over just the legal moves of each state, in the order of its legal_action_ids, and the values
+        """
+        with torch.inference_mode():
+            p, v = self.model(self.prepare(state))
+            if not self.sparse_policy:
+                return [p[i][legal] for i, legal in enumerate(legal_action_ids)], v
+
+            if len(legal_action_ids) == 1:
+                legal = torch.as_tensor(legal_action_ids[0])
+                return [torch.softmax(torch.addmv(self.p_bias[legal], self.p_weight[legal], p[0]), dim=0)], v
+
+            # For a batch, one dense matmul beats gathering each state's rows. The softmax is still over legal moves only
+            sizes = [len(legal) for legal in legal_action_ids]
+            legal = torch.as_tensor([a for legal in legal_action_ids for a in legal])
+            rows = torch.repeat_interleave(torch.arange(len(sizes)), torch.as_tensor(sizes))
+            logits = torch.addmm(self.p_bias, p, self.p_weight.t())[rows, legal]
+
+            return [torch.softmax(x, dim=0) for x in logits.split(sizes)], v
@@ -1,9 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
 import os
+import random
+
 import torch
-from torch.utils.data import DataLoader, IterableDataset
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
 
 from catan2 import config, log
 
+from .compact import decode
+from .device import device
+from .records import has_records, num_samples, read_records, replay_together
+from .shards import Shard, has_manifest, read_manifest
+from .symmetry import augment_collate
+
+
+def shuffled(samples, buffer_size: int):
+    """
+    Samples pass thru a bounded shuffle buffer, so neighbours from the same game get spread out
+    """
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+
+        i = random.randrange(len(buffer))
+        buffer[i], sample = sample, buffer[i]
+        yield sample
+
+    random.shuffle(buffer)
+    yield from buffer
+
+
+def worker_share(items: list):
+    """
+    This DataLoader worker's share of the items for this epoch
+    The workers all shuffle with the same seed, so between them every item is covered exactly once
+    """
+    worker = get_worker_info()
+    if worker is None:
+        rng = random.Random()
+        worker_id, num_workers = 0, 1
+    else:
+        rng = random.Random(worker.seed - worker.id)
+        worker_id, num_workers = worker.id, worker.num_workers
+
+    items = items.copy()
+    rng.shuffle(items)
+
+    return items[worker_id::num_workers]
+
 
 class CatanDataSet(IterableDataset):
     def __init__(self, sample_dir):
@@ -14,11 +60,17 @@ class CatanDataSet(IterableDataset):
         return self.len
 
     def get_sample(self):
-        for f in [self.sample_dir + filename for filename in os.listdir(self.sample_dir)]:
+        # Each DataLoader worker takes its own share of the files, rather than all of them
+        filenames = sorted(os.listdir(self.sample_dir))
+        worker = get_worker_info()
+        if worker is not None:
+            filenames = filenames[worker.id::worker.num_workers]
+
+        for f in [self.sample_dir + filename for filename in filenames]:
             log.trace(f'Now taking from file {f}')
             data = torch.load(f)
             for item in data:
-                yield item
+                yield decode(item)
 
     def __iter__(self):
         return self.get_sample()
@@ -27,13 +79,96 @@ class CatanDataSet(IterableDataset):
         return self.get_sample()
 
 
+class ShardStream(IterableDataset):
+    """
+    Stream thru a shard directory in a random order, an epoch at a time
+
+    - Each DataLoader worker gets its own share of the shards
+    - Samples pass thru a bounded shuffle buffer
+    - The next shard is read in the background while the current one is being used
+    """
+
+    def __init__(self, directory: str, shuffle_buffer: int = None, prefetch: bool = None):
+        loader_config = config['ai']['zero']['samples']['loader']
+        self.shuffle_buffer = shuffle_buffer or loader_config['shuffle_buffer']
+        self.prefetch = prefetch if prefetch is not None else loader_config['prefetch']
+
+        self.manifest = [(directory, entry['name'], entry['size']) for entry in read_manifest(directory)]
+
+    def __len__(self):
+        return sum(size for _, _, size in self.manifest)
+
+    def shards(self):
+        return [Shard(*entry) for entry in worker_share(self.manifest)]
+
+    def samples(self):
+        shards = self.shards()
+        if not shards:
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            load = executor.submit(shards[0].load) if self.prefetch else None
+            for k, shard in enumerate(shards):
+                shard = load.result() if self.prefetch else shard.load()
+                if self.prefetch and k + 1 < len(shards):
+                    load = executor.submit(shards[k + 1].load)
+
+                for i in range(len(shard)):
+                    yield shard[i]
+
+    def __iter__(self):
+        return shuffled(self.samples(), self.shuffle_buffer)
+
+
+class RecordStream(IterableDataset):
+    """
+    Stream thru a directory of game records, replaying each game to get its samples back (see records.py)
+
+    Replaying is where the time goes, so this is the one that gains the most from more loader workers.
+    Each worker replays its own share of the games, several side by side so their positions get encoded in one batch.
+    """
+
+    def __init__(self, directory: str, shuffle_buffer: int = None, games_at_once: int = None):
+        loader_config = config['ai']['zero']['samples']['loader']
+        self.shuffle_buffer = shuffle_buffer or loader_config['shuffle_buffer']
+        self.games_at_once = games_at_once or loader_config['games_at_once']
+        self.records = read_records(directory)
+
+    def __len__(self):
+        return num_samples(self.records)
+
+    def samples(self):
+        records = worker_share(self.records)
+        for i in range(0, len(records), self.games_at_once):
+            yield from replay_together(records[i:i + self.games_at_once])
+
+    def __iter__(self):
+        return shuffled(self.samples(), self.shuffle_buffer)
+
+
 class CatanDataLoader(DataLoader):
-    def __init__(self, directory: str, batch_size: int = None, pin_memory: bool = False):
-        dataset = CatanDataSet(directory)
+    def __init__(self, directory: str, batch_size: int = None, pin_memory: bool = None, num_workers: int = None,
+                 augment: bool = False):
+        # Shards and records get shuffled as they stream by. The old pickled files are read in order
+        if has_manifest(directory):
+            dataset = ShardStream(directory)
+        elif has_records(directory):
+            dataset = RecordStream(directory)
+        else:
+            dataset = CatanDataSet(directory)
         batch_size = batch_size or config['ai']['batch_size']
+        num_workers = num_workers if num_workers is not None else config['ai']['zero']['samples']['loader']['num_workers']
+        # Batches come out on the CPU. Pinned, the copy to the GPU in the train loop can overlap with the next batch
+        pin_memory = pin_memory if pin_memory is not None else device.type == 'cuda'
+
+        # Training batches get turned and mirrored at random, so each sample teaches about more than one orientation
+        # Only for a training set - the dev loss should be measured on the samples as they are
+        collate_fn = augment_collate if augment and config['ai']['zero']['samples']['augment']['enabled'] else None
 
         super().__init__(
             dataset=dataset,
             batch_size=batch_size,
-            pin_memory=pin_memory
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            collate_fn=collate_fn
         )
@@ -0,0 +1,86 @@
+"""
+Distillation
+
+Train a small student net to say what the big teacher net says, so search can afford more nodes per second.
+The targets are the teacher's own policy and value on stored positions, not the MCTS targets.
+"""
+
+import timeit
+
+import torch
+from torch import optim
+from torch.utils.data import DataLoader
+
+from catan2 import config, log
+
+from .cnn import CNN
+from .device import device
+
+
+def make_student(channels: int = None, res_layers: int = None):
+    student_config = config['ai']['zero']['student']
+    student = CNN(
+        channels=channels or student_config['channels'],
+        res_layers=res_layers if res_layers is not None else student_config['res_layers']
+    ).to(device)
+
+    # The student fits the teacher's outputs from scratch - the net's own learning rate (and its schedule, which
+    # distill never steps) is tuned for fine-tuning a trained net on MCTS targets and is far too small for that
+    student.optimizer = optim.Adam(student.parameters(), lr=student_config['lr'])
+
+    return student
+
+
+def distillation_loss(pi_student, pi_teacher, v_student, v_teacher):
+    # Cross entropy against the teacher's policy is KL(teacher || student) plus a constant
+    policy_error = torch.sum(-pi_teacher * (1e-8 + pi_student).log())
+    value_error = torch.sum((v_student.view(-1) - v_teacher.view(-1)) ** 2)
+
+    return policy_error + value_error
+
+
+def distill(teacher: CNN, student: CNN, train_set, num_epochs: int = None):
+    """
+    train_set - batches of (state, pi, v) like a CatanDataLoader, a list of single samples,
+                or a function returning each epoch's batches, like lambda: Zero.replay().batches()
+    Only the states are used
+    """
+    student_config = config['ai']['zero']['student']
+    num_epochs = num_epochs or student_config['num_epochs']
+    if isinstance(train_set, list):
+        train_set = DataLoader(train_set, batch_size=student_config['batch_size'], shuffle=True)
+
+    # The teacher is asked the way search asks it, with BatchNorm on its running statistics
+    was_training = teacher.training
+    teacher.eval()
+
+    for epoch in range(num_epochs):
+        start = timeit.default_timer()
+        epoch_loss = 0.0
+        num_samples = 0
+
+        epoch_set = train_set() if callable(train_set) else train_set
+        for game_state, _, _ in epoch_set:
+            game_state = game_state.to(device)
+            with torch.no_grad():
+                pi_teacher, v_teacher = teacher(game_state)
+
+            student.optimizer.zero_grad()
+            pi_student, v_student = student(game_state)
+            loss = distillation_loss(pi_student, pi_teacher, v_student, v_teacher)
+            loss.backward()
+            student.optimizer.step()
+
+            epoch_loss += loss.item()
+            num_samples += len(game_state)
+
+        log.info('distill epoch finished', data={
+            'epoch': epoch + 1,
+            'duration': timeit.default_timer() - start,
+            'loss_per_sample': epoch_loss / num_samples if num_samples else 0
+        }, tags=['experiment'])
+
+    teacher.train(was_training)
+    student.version += 1
+
+    return student
@@ -0,0 +1,228 @@
+"""
+Leaf Evaluators
+
+Whatever the search asks about a position: priors over the legal moves, and a value for the player to move.
+The net is the real thing. The heuristic and the rollouts are cheap stand-ins, for bootstrapping
+or for boxes where the net is the bottleneck.
+"""
+
+from abc import ABC, abstractmethod
+import math
+import timeit
+
+import torch
+
+from catan2 import config
+from catan2.agents.random import Random
+from catan2.agents.simple import Simple
+from catan2.catan.actions import get_action_by_id, get_legal_action_ids
+from catan2.constants import NUM_UNIQUE_ACTIONS
+
+from .cnn import CNN
+from .compiled import CompiledNet
+from .device import device
+from .gamestate import GameState
+
+
+class Evaluator(ABC):
+    # Evaluators without a net have nothing worth caching, and never change
+    cache = None
+    version = 0
+
+    @abstractmethod
+    def evaluate(self, games, legal_action_ids, stats):
+        """
+        Evaluate several positions at once
+        Returns (priors, value) for each position. The priors are masked to legal moves, but not normalized
+        """
+
+
+def uniform_priors(legal_action_ids):
+    priors = torch.zeros(NUM_UNIQUE_ACTIONS)
+    priors[legal_action_ids] = 1
+    return priors
+
+
+class NetEvaluator(Evaluator):
+    """
+    Ask the net (or the net's cache) about several positions in one forward pass
+    On CPU the forward goes thru a compiled (or int8 quantized) copy of the net, rebuilt whenever the net's version changes
+    """
+
+    def __init__(self, net, compiled: bool = None, quantized: bool = False):
+        self.net = net
+        self.use_compiled = compiled if compiled is not None else config['ai']['zero']['compiled']['enabled']
+        self.use_quantized = quantized
+        self.compiled = None
+
+    def model(self):
+        if not (self.use_compiled or self.use_quantized) or not isinstance(self.net, CNN) or device.type != 'cpu':
+            return self.net
+
+        if self.compiled is None or self.compiled.version != self.net.version:
+            self.compiled = CompiledNet(self.net, quantize=self.use_quantized)
+
+        return self.compiled
+
+    @property
+    def cache(self):
+        return self.model().cache
+
+    @property
+    def version(self):
+        return self.net.version
+
+    def evaluate(self, games, legal_action_ids, stats):
+        net = self.model()
+
+        with stats.timer('encode'):
+            states = GameState.batch(games)
+
+        results = [None] * len(games)
+        keys = [None] * len(games)
+        if net.cache is not None:
+            for i, state in enumerate(states):
+                keys[i] = net.cache.key(state, legal_action_ids[i])
+                results[i] = net.cache.get(keys[i], net.version)
+                if results[i] is not None:
+                    stats.cache_hits += 1
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if not misses:
+            return results
+
+        # In training mode BatchNorm would mix statistics across unrelated positions, so batches use the running stats
+        batched = len(misses) > 1 and isinstance(net, torch.nn.Module) and net.training
+        if batched:
+            net.eval()
+
+        # A compiled net can work out the priors of just the legal moves
+        start = timeit.default_timer()
+        if isinstance(net, CompiledNet):
+            legal_priors, value_estimates = net.legal_priors(
+                states[misses],
+                [legal_action_ids[i] for i in misses]
+            )
+        else:
+            with torch.no_grad():
+                child_priors, value_estimates = net(states[misses])
+            child_priors = child_priors.view(len(misses), -1).cpu()
+            legal_priors = [child_priors[j][legal_action_ids[i]] for j, i in enumerate(misses)]
+        latency = timeit.default_timer() - start
+        stats.timers['nn'] += latency
+        stats.record_eval(latency, len(misses))
+
+        if batched:
+            net.train()
+
+        value_estimates = value_estimates.view(-1).cpu()
+        for j, i in enumerate(misses):
+            masked_priors = torch.zeros(NUM_UNIQUE_ACTIONS)
+            masked_priors[legal_action_ids[i]] = legal_priors[j]
+            results[i] = (masked_priors, value_estimates[j].item())
+
+            if net.cache is not None:
+                net.cache.put(keys[i], *results[i])
+
+        return results
+
+
+class HeuristicEvaluator(Evaluator):
+    """
+    Uniform priors, and a value from how far ahead the player to move is
+    A player's score is their victory points plus their expected resources per roll, like Simple.calc_point_value
+    """
+
+    def __init__(self, income_weight: float = None, scale: float = None):
+        heuristic_config = config['ai']['zero']['evaluator']['heuristic']
+        self.income_weight = income_weight if income_weight is not None else heuristic_config['income_weight']
+        self.scale = scale if scale is not None else heuristic_config['scale']
+
+    def score(self, player):
+        income = sum(player.resource_generation) / 36
+        return player.victory_points + self.income_weight * income
+
+    def value(self, game):
+        me = game.current_player
+        best_opponent = max(self.score(player) for player in game.players if player is not me)
+        return math.tanh(self.scale * (self.score(me) - best_opponent))
+
+    def evaluate(self, games, legal_action_ids, stats):
+        start = timeit.default_timer()
+        results = [(uniform_priors(legal), self.value(game)) for game, legal in zip(games, legal_action_ids)]
+        stats.record_other_eval('heuristic', timeit.default_timer() - start, len(games))
+
+        return results
+
+
+class RolloutEvaluator(Evaluator):
+    """
+    Uniform priors, and a value from playing the game out on a copy with a fast policy (Random or Simple)
+    Rollouts that run past max_actions are scored with the heuristic
+    """
+    policies = {
+        'random': Random,
+        'simple': Simple
+    }
+
+    def __init__(self, policy: str = None, max_actions: int = None):
+        rollout_config = config['ai']['zero']['evaluator']['rollout']
+        policy = (policy or rollout_config['policy']).lower()
+        self.policy = self.policies[policy]()
+        self.fallback = Random()
+        self.max_actions = max_actions or rollout_config['max_actions']
+        self.heuristic = HeuristicEvaluator()
+
+    def act(self, game):
+        player = game.current_player
+        self.policy.player = player
+        action = self.policy.choose_action()
+
+        # Simple gives up when none of its priorities apply
+        if action is None:
+            self.fallback.player = player
+            action = self.fallback.choose_action()
+
+        func, args, kwargs = action
+        func(*args, **kwargs)
+
+    def value(self, game):
+        me = game.current_player.num
+        game = game.copy()
+
+        for _ in range(self.max_actions):
+            if game.is_finished:
+                return 1 if game.current_player.num == me else -1
+
+            if game.can_roll():
+                game.current_player.roll()
+                continue
+
+            legal_action_ids = get_legal_action_ids(game)
+            if len(legal_action_ids) == 1:
+                func, args, kwargs = get_action_by_id(game, legal_action_ids[0])
+                func(*args, **kwargs)
+            else:
+                self.act(game)
+
+        value = self.heuristic.value(game)
+        return value if game.current_player.num == me else -value
+
+    def evaluate(self, games, legal_action_ids, stats):
+        start = timeit.default_timer()
+        results = [(uniform_priors(legal), self.value(game)) for game, legal in zip(games, legal_action_ids)]
+        stats.record_other_eval('rollout', timeit.default_timer() - start, len(games))
+
+        return results
+
+
+def get_evaluator(net, kind: str = None, self_play: bool = False):
+    kind = (kind or config['ai']['zero']['evaluator']['type']).lower()
+    if kind == 'net':
+        return NetEvaluator(net, quantized=self_play and config['ai']['zero']['quantized']['enabled'])
+    elif kind == 'heuristic':
+        return HeuristicEvaluator()
+    elif kind == 'rollout':
+        return RolloutEvaluator()
+    else:
+        raise NotImplementedError(f'There is no evaluator of type {kind}')
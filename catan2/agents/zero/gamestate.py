@@ -3,16 +3,56 @@ Game State
 
 Copy the description of the current state of a game into a portable format.
 This format can be easily copied, or turned into a tensor.
+
+Encoding is done in place, in buffers each game keeps for itself (see Features), redoing only what has changed:
+- the board planes never change
+- piece marks are only ever added, so only new pieces get marked, at cells worked out ahead of time for every point and lane
+- the card planes are a broadcast each
+The tensor is kept until the game's next action, so asking about the same position again costs nothing.
+GameState.batch writes many positions into one [n, layers, width, width] tensor, each plane for all of them at once.
 """
 
 import numpy as np
 import torch
 
+from catan2.constants import BOARD_WIDTH
+
 from .device import device
 
 
+class Features:
+    """
+    One game's encoding buffers
+    A copy of the game gets a copy of these, so a search only has to encode what its move changed
+    """
+
+    def __init__(self, num_players: int, width: int):
+        # Roads and buildings of each player, by player num, with the cells flattened
+        self.pieces = np.zeros((num_players, 2, width * width), dtype=int)
+        self.num_roads = [0] * num_players
+        self.num_buildings = [0] * num_players
+
+        self.buffer = np.zeros((sum(GameState.num_layers.values()), width, width), dtype=int)
+
+        self.version = None
+        self.tensor = None
+
+    def copy(self):
+        features = Features.__new__(Features)
+        features.pieces = self.pieces.copy()
+        features.num_roads = self.num_roads.copy()
+        features.num_buildings = self.num_buildings.copy()
+        features.buffer = self.buffer.copy()
+        features.version = self.version
+        features.tensor = self.tensor
+
+        return features
+
+
 class GameState:
     _board_tensor = None  # The board doesn't change during the game, so only compute it once
+    _lane_cells = None    # Nor do the hexes around each lane and point
+    _point_cells = None
 
     num_layers = {
         'board': 5,
@@ -24,24 +64,48 @@ class GameState:
     def __init__(self, game):
         self.game = game
 
-        board_tensor = self.get_board_tensor()
-        piece_tensor = self.get_piece_tensor()
-        resource_card_tensor = self.get_resource_card_tensor()
-        development_card_tensor = self.get_development_card_tensor()
-
-        complete_game_tensor = np.concatenate((
-            board_tensor,
-            piece_tensor,
-            resource_card_tensor,
-            development_card_tensor
-        ), axis=0)
+        features = self.get_features(game)
+        if features.version != game.version:
+            self.mark_pieces(game, features)
+            self.fill(features.buffer[np.newaxis], [game])
+            features.tensor = torch.tensor(features.buffer, device=device)
+            features.version = game.version
 
-        self._t = torch.as_tensor(complete_game_tensor, device=device)
+        self._t = features.tensor
 
     @property
     def tensor(self):
         return self._t
 
+    @staticmethod
+    def empty(n: int, width: int = BOARD_WIDTH):
+        """
+        A [n, layers, width, width] tensor to encode (or stack) positions into. Keep one around to save allocating it again
+        """
+        return torch.zeros((n, sum(GameState.num_layers.values()), width, width), dtype=torch.long)
+
+    @staticmethod
+    def batch(games, out: torch.tensor = None, on_device: bool = True):
+        """
+        Encode several games at once, one row each, into out if it's given
+        Each game's pieces are marked as usual, then every plane is written for all of the games together
+        on_device=False leaves the result on the CPU, e.g. in a DataLoader worker, which mustn't touch the GPU
+        """
+        out = out[:len(games)] if out is not None else GameState.empty(len(games), games[0].board.width)
+
+        for game in games:
+            GameState.mark_pieces(game, GameState.get_features(game))
+        GameState.fill(out.numpy(), games)
+
+        return out.to(device) if on_device else out
+
+    @staticmethod
+    def get_features(game):
+        if game.features is None:
+            game.features = Features(len(game.players), game.board.width)
+
+        return game.features
+
     @staticmethod
     def get_player_list_with_current_player_first(game):
         player_list = game.players.copy()
@@ -50,60 +114,78 @@ class GameState:
 
         return player_list
 
-    def get_board_tensor(self):
+    @staticmethod
+    def get_board_tensor(board):
         if GameState._board_tensor is None:
-            GameState._board_tensor = self.tensorify_board()
+            GameState._board_tensor = GameState.tensorify_board(board)
 
         return GameState._board_tensor
 
-    def tensorify_board(self):
-        board = self.game.board
+    @staticmethod
+    def tensorify_board(board):
         num_layers = GameState.num_layers['board']
         t = np.zeros((num_layers, board.width, board.width), dtype=int)
 
-        for h in self.game.board.hexes:
+        for h in board.hexes:
             if h.resource.id > 4: continue
             t[h.resource.id][h.q][h.r] = h.roll_chance
 
         return t
 
-    def get_piece_tensor(self):
-        board = self.game.board
-        num_layers = GameState.num_layers['pieces']
-        t = np.zeros((num_layers, board.width, board.width), dtype=int)
+    @staticmethod
+    def get_scatter_indices(board):
+        """
+        The flattened cells of the hexes around each lane and each point - where a road or a building leaves its marks
+        """
+        if GameState._lane_cells is None:
+            def cells(points):
+                return np.array(sorted({h.q * board.width + h.r for point in points for h in point.hexes}), dtype=int)
 
-        for p, player in enumerate(self.get_player_list_with_current_player_first(self.game)):
-            for road in player.roads:
-                for point in road.lane.points:
-                    for h in point.hexes:
-                        t[h.q][h.r][p*3] = 1
-            for settlement in player.settlements:
-                for h in settlement.point.hexes:
-                    t[p*3 + 1][h.q][h.r] = 1
-            for city in player.cities:
-                for h in city.point.hexes:
-                    t[p*3 + 1][h.q][h.r] = 1
+            GameState._lane_cells = [cells(lane.points) for lane in board.lanes]
+            GameState._point_cells = [cells([point]) for point in board.points]
 
-        return t
+        return GameState._lane_cells, GameState._point_cells
 
-    def get_resource_card_tensor(self):
-        board = self.game.board
-        num_layers = GameState.num_layers['resource_cards']
-        t = np.zeros((num_layers, board.width, board.width), dtype=int)
+    @staticmethod
+    def mark_pieces(game, features: Features):
+        lane_cells, point_cells = GameState.get_scatter_indices(game.board)
 
-        for p, player in enumerate(self.get_player_list_with_current_player_first(self.game)):
-            for i, amt in enumerate(player.resource_cards):
-                t[(p*5 + i), :, :] = amt
+        for player in game.players:
+            n = player.num
 
-        return t
+            for road in player.roads[features.num_roads[n]:]:
+                features.pieces[n, 0, lane_cells[road.lane.id]] = 1
+            features.num_roads[n] = len(player.roads)
 
-    def get_development_card_tensor(self):
-        board = self.game.board
-        num_layers = GameState.num_layers['development_cards']
-        t = np.zeros((num_layers, board.width, board.width), dtype=int)
+            # A settlement that becomes a city leaves the same marks, so only a change in the count needs a look
+            num_buildings = len(player.settlements) + len(player.cities)
+            if num_buildings != features.num_buildings[n]:
+                for building in player.settlements + player.cities:
+                    features.pieces[n, 1, point_cells[building.point.id]] = 1
+                features.num_buildings[n] = num_buildings
 
-        for p, player in enumerate(self.get_player_list_with_current_player_first(self.game)):
-            for d, amt in enumerate(player.development_cards):
-                t[(p * 5 + d), :, :] = amt
-
-        return t
+    @staticmethod
+    def fill(buffer: np.ndarray, games):
+        """
+        Write every plane of each game's position into buffer[i], from its marked pieces and its players' cards
+        """
+        n, _, width, _ = buffer.shape
+        players = [GameState.get_player_list_with_current_player_first(game) for game in games]
+        num_players = len(players[0])
+
+        start = GameState.num_layers['board']
+        buffer[:, :start] = GameState.get_board_tensor(games[0].board)
+
+        pieces = np.stack([game.features.pieces[[player.num for player in ps]] for game, ps in zip(games, players)])
+        pieces = pieces.reshape(n, num_players, 2, width, width)
+        for p in range(num_players):
+            buffer[:, start + p*3] = pieces[:, p, 0]
+            buffer[:, start + p*3 + 1] = pieces[:, p, 1]
+            buffer[:, start + p*3 + 2] = 0
+
+        start += GameState.num_layers['pieces']
+        end = start + GameState.num_layers['resource_cards']
+        buffer[:, start:end] = np.array([[player.resource_cards for player in ps] for ps in players]).reshape(n, -1, 1, 1)
+
+        start, end = end, end + GameState.num_layers['development_cards']
+        buffer[:, start:end] = np.array([[player.development_cards for player in ps] for ps in players]).reshape(n, -1, 1, 1)
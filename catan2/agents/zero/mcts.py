@@ -3,6 +3,8 @@ Monte Carlo Tree Search
 
 Look it up
 """
+from math import ceil
+import random
 import time
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 import timeit
@@ -13,42 +15,226 @@ import typing
 from catan2 import config, log
 from catan2.catan.actions import get_action_by_id, get_legal_action_ids
 
+from catan2.catan.board import Hex
+
+from .evaluator import Evaluator, NetEvaluator
 from .gamestate import GameState
+from .pool import NodePool
+from .telemetry import SearchStats
 
 NUM_UNIQUE_ACTIONS = 207
 
+# Actions whose result is up to chance, and the keyword that lets the tree pick the result
+ROLL_ACTION_ID = 0
+BUY_DEVELOPMENT_CARD_ACTION_ID = 2
+CHANCE_KWARGS = {
+    ROLL_ACTION_ID: 'total',
+    BUY_DEVELOPMENT_CARD_ACTION_ID: 'card'
+}
 
-class MCTNode:
-    # executor = ProcessPoolExecutor(max_workers=6)
-    # executor = ThreadPoolExecutor(max_workers=6)
 
-    def __init__(self, game, net, action_id=None, parent=None):
-        log.trace(f"id: {id(self)}", tags=['mcts'])
-        self.game = game.copy()
+def is_chance_action(action_id):
+    return config['ai']['zero']['mcts']['chance_nodes'] and action_id in CHANCE_KWARGS
+
+
+def chance_outcomes(game, action_id):
+    """
+    Every way a chance action can turn out, with its probability
+    """
+    if action_id == ROLL_ACTION_ID:
+        totals = range(2, 13)
+        return list(totals), [Hex.roll_chance_arr[total] / 36 for total in totals]
+
+    deck = game.development_card_deck
+    cards = sorted(set(deck))
+    return cards, [deck.count(card) / len(deck) for card in cards]
+
+
+def roll_total(game):
+    # The tree picks the total of a roll, not the dice, so that is all positions can be compared on
+    return sum(game.last_roll) if game.last_roll[0] else None
+
+
+def take_action(game, action_id, outcome=None):
+    func, args, kwargs = get_action_by_id(game, action_id)
+    if outcome is not None:
+        kwargs = {**kwargs, CHANCE_KWARGS[action_id]: outcome}
+    func(*args, **kwargs)
+
+
+def advance(game, action_id, outcome, stats):
+    """
+    Take action_id (if there is one), then every forced move after it
+    Returns the legal action ids of wherever the game ends up
+
+    If the new game state leaves a player with exactly 1 move, automatically take that move
+    Unless that move is up to chance - then it is left for a ChanceNode
+    """
+    if action_id is not None:
+        with stats.timer('action'):
+            take_action(game, action_id, outcome)
+
+    with stats.timer('legality'):
+        legal_action_ids = get_legal_action_ids(game)
+    while len(legal_action_ids) == 1 and not is_chance_action(legal_action_ids[0]):
+        stats.forced_moves += 1
+        with stats.timer('action'):
+            take_action(game, legal_action_ids[0])
+
+        with stats.timer('legality'):
+            legal_action_ids = get_legal_action_ids(game)
+
+    return legal_action_ids
+
+
+def evaluate(net, games, legal_action_ids, stats):
+    """
+    Evaluate several positions at once, with an Evaluator or a bare net
+    Returns (priors, value) for each position. The priors are masked to legal moves, but not normalized
+    """
+    evaluator = net if isinstance(net, Evaluator) else NetEvaluator(net, compiled=False)
+    return evaluator.evaluate(games, legal_action_ids, stats)
+
+
+def kl_divergence(p, q, eps=1e-8):
+    """
+    KL(p || q) between two visit distributions over the same actions
+    """
+    p = p + eps
+    q = q + eps
+    return float(np.sum(p * np.log(p / q)))
+
+
+def should_stop_early(root, i, num_iterations, previous_pi):
+    """
+    True once more searching can't change the answer much:
+    - the most visited child can't be caught by the runner up in the iterations left, or
+    - the root's visit distribution has barely moved since the last check
+    """
+    if num_iterations is not None:
+        visits = sorted((s.n for s in root.children), reverse=True) + [0, 0]
+        if visits[0] - visits[1] > num_iterations - i:
+            return True
+
+    if previous_pi is not None:
+        return kl_divergence(root.pi, previous_pi) < config['ai']['zero']['mcts']['early_stop']['kl_threshold']
+
+    return False
+
+
+class Node:
+    needs_children = False  # whether the node's visits are nothing but its children's
+
+    def __init__(self, game, action_id=None, parent=None, tree=None):
+        self.game = game
+        self.tree = tree if tree is not None else parent.tree
 
         self.w = 0  # total q value
         self.n = 0  # number of visits
 
         self.action_id = action_id
         self.parent = parent
+
+    @property
+    def q(self):
+        n = self.n or 1
+        return self.w / n
+
+    def backup(self):
+        log.trace(f'node id: {id(self)}', tags=['mcts'])
+
+        val = self.q
+        current = self
+
+        while current.parent is not None:
+            if current.game.current_player.num != current.parent.game.current_player.num:
+                val *= -1
+
+            current = current.parent
+            current.w += val
+
+    def child_q(self, s):
+        """
+        A child's q from this node's point of view - the child may have the other player to move
+        """
+        return s.q if s.game.current_player.num == self.game.current_player.num else -s.q
+
+    @property
+    def total_value(self):
+        """
+        Everything this node has backed up to its parent, from its own point of view
+        """
+        return self.w
+
+    def forget(self):
+        """
+        Take this subtree's visits and value back out of every ancestor, as if the search had never been here
+        """
+        n, val = self.n, self.total_value
+        current = self
+
+        while current.parent is not None:
+            if current.game.current_player.num != current.parent.game.current_player.num:
+                val *= -1
+
+            current = current.parent
+            current.n -= n
+            current.w -= val
+
+    def clear(self):
+        """
+        Drop everything this node holds on to, so the pool can reuse it
+        """
+        self.game = None
+        self.parent = None
+
+    def prepared_edges(self):
+        return []
+
+
+class Edge:
+    """
+    A legal move out of a node
+    The node at the other end is only built once the search actually goes there
+    """
+    __slots__ = ['action_id', 'prior', 'node', 'prepared']
+
+    def __init__(self, action_id, prior):
+        self.action_id = action_id
+        self.prior = prior
+        self.node = None
+        self.prepared = None  # (game, legal action ids, evaluation), if the child was evaluated ahead of time
+
+
+class MCTNode(Node):
+    # executor = ProcessPoolExecutor(max_workers=6)
+    # executor = ThreadPoolExecutor(max_workers=6)
+
+    def __init__(self, game, net, action_id=None, parent=None, outcome=None, tree=None, prepared=None):
+        log.trace(f"id: {id(self)}", tags=['mcts'])
+        tree = tree if tree is not None else parent.tree
+
+        # A prepared child already has its own copy of the game, with the action (and forced moves) taken
+        evaluation = None
+        if prepared is not None:
+            game, legal_action_ids, evaluation = prepared
+        else:
+            with tree.stats.timer('copy'):
+                game = game.copy()
+        super().__init__(game, action_id, parent, tree)
+
+        self.outcome = outcome
         self.original_priors = None
-        self.legal_action_ids = get_legal_action_ids(self.game)
+        self.legal_action_ids = None
         self.priors = None
-        self.children = [0] * NUM_UNIQUE_ACTIONS
+        self.edges = []  # legal moves, highest prior first
 
         self.expansion = None
 
-        if action_id is not None:
-            func, args, kwargs = get_action_by_id(self.game, action_id)
-            func(*args, **kwargs)
-
-        # If the new game state leaves a player with exactly 1 move, automatically take that move
-        self.legal_action_ids = get_legal_action_ids(self.game)
-        while len(self.legal_action_ids) == 1:
-            func, args, kwargs = get_action_by_id(self.game, self.legal_action_ids[0])
-            func(*args, **kwargs)
-
-            self.legal_action_ids = get_legal_action_ids(self.game)
+        if prepared is not None:
+            self.legal_action_ids = legal_action_ids
+        else:
+            self.legal_action_ids = advance(self.game, action_id, outcome, self.tree.stats)
 
         if self.game.is_finished:
             return
@@ -58,7 +244,7 @@ class MCTNode:
             self.expansion.node = self
             self.expansion.add_done_callback(MCTNode.backup_from_future)
         else:
-            self.expand(net)
+            self.expand(net, evaluation)
             self.backup()
 
     @property
@@ -66,87 +252,174 @@ class MCTNode:
         if self.game.is_finished:
             return 1
         else:
-            n = self.n or 1
-            return self.w / n
+            return super().q
+
+    @property
+    def total_value(self):
+        # A finished game backs up a win on every visit, without ever adding to w
+        return self.n if self.game.is_finished else self.w
+
+    @property
+    def children(self):
+        return [edge.node for edge in self.edges if edge.node is not None]
+
+    def detach(self, child):
+        for edge in self.edges:
+            if edge.node is child:
+                edge.node = None
+
+    def prepared_edges(self):
+        return [edge for edge in self.edges if edge.prepared is not None]
+
+    def clear(self):
+        super().clear()
+        self.edges = []
+        self.priors = None
+        self.original_priors = None
 
     @property
     def pi(self):
-        pi = np.asarray([0 if not isinstance(s, MCTNode) else s.n for s in self.children])
+        pi = np.zeros(NUM_UNIQUE_ACTIONS)
+        for edge in self.edges:
+            if edge.node is not None:
+                pi[edge.action_id] = edge.node.n
+
         pi_sum = np.sum(pi)
         if pi_sum > 0:
             pi = pi/pi_sum
 
         return pi
 
-    def calc_u_for_child(self, i):
-        if self.priors[i] == 0:
-            return float("-inf")
-
-        s = self.children[i]
+    def calc_u_for_edge(self, edge, sqrt_n):
         c_puct = config['ai']['zero']['mcts']['c_puct']
+        s = edge.node
 
-        if isinstance(s, MCTNode):
-            # if s.expansion is not None and s.expansion.running():
-            #     expanding.append(s)
-            #     continue
-            q = s.q if s.game.current_player.num == self.game.current_player.num else -s.q
-            return q + c_puct * self.priors[i] * np.sqrt(self.n) / (1 + s.n)
+        if s is not None:
+            return self.child_q(s) + c_puct * edge.prior * sqrt_n / (1 + s.n)
         else:
-            return self.q + c_puct * self.priors[i] * np.sqrt(self.n)
-
-    def favorite_child(self, net):
-        log.trace(f'node id: {id(self)}', tags=['mcts'])
-
-        expanding = []
-
-        us = [self.calc_u_for_child(i) for i in range(NUM_UNIQUE_ACTIONS)]
-        best_a = np.argmax(us)
+            return self.q + c_puct * edge.prior * sqrt_n
 
-        if us[best_a] == float("-inf"):
-            if len(expanding) > 0:
-                log.trace("Favorite child is already expanding. Waiting...", tags=['mcts'])
-                node = np.random.choice(expanding)
-                wait([node.expansion])
-                return node
-            else:
-                log.error("No legal moves detected", data={
-                    "player_num": self.game.player.num,
-                    "original_priors": self.original_priors.data.numpy().tolist(),
-                    "legal_actions": get_legal_action_ids(self.game),
-                    "priors": self.priors.data.numpy().tolist()
-                })
-                raise Exception(f"No legal moves for player {self.game.player.name}")
+    def widened_edges(self):
+        """
+        Progressive widening: only the k(n) = c * n^alpha highest prior moves are up for selection
+        The low prior moves (e.g. most trades) only come into play once this node has seen enough visits
+        """
+        widening = config['ai']['zero']['mcts']['widening']
+        if not widening['enabled']:
+            return self.edges
 
-        a = best_a
+        k = max(1, ceil(widening['c'] * self.n ** widening['alpha']))
+        return self.edges[:k]
 
-        if not isinstance(self.children[a], MCTNode):
+    def favorite_child(self, net):
+        log.trace(f'node id: {id(self)}', tags=['mcts'])
+        self.tree.stats.selections += 1
+
+        edges = self.widened_edges()
+        if not edges:
+            log.error("No legal moves detected", data={
+                "player_num": self.game.current_player.num,
+                "original_priors": self.original_priors.data.numpy().tolist(),
+                "legal_actions": get_legal_action_ids(self.game),
+                "priors": self.priors.data.numpy().tolist()
+            })
+            raise Exception(f"No legal moves for player {self.game.current_player.name}")
+
+        sqrt_n = np.sqrt(self.n)
+        edge = max(edges, key=lambda e: self.calc_u_for_edge(e, sqrt_n))
+
+        if edge.node is None:
             log.trace("Favorite child is new", tags=['mcts'])
-            self.children[a] = MCTNode(self.game, net, a, parent=self)
+            if is_chance_action(edge.action_id):
+                edge.node = self.tree.pool.acquire(ChanceNode, net, edge.action_id, parent=self)
+            else:
+                prepared = self.tree.pool.take_prepared(edge)
+                edge.node = self.tree.pool.acquire(MCTNode, self.game, net, edge.action_id, parent=self, prepared=prepared)
         else:
             log.trace("Favorite child is already expanded", tags=['mcts'])
 
-        return self.children[a]
+        return edge.node
 
-    def expand(self, net):
+    def expand(self, net, evaluation=None):
         log.trace(f'node id: {id(self)}', tags=['mcts'])
-        MCT.expand_count += 1
+        self.tree.stats.expansions += 1
 
-        with torch.no_grad():
-            child_priors, value_estimate = net(GameState(self.game).tensor)
+        masked_priors, self.w = evaluation if evaluation is not None else self.evaluate(net)
 
-        self.priors = child_priors.view(-1).cpu()
-        self.original_priors = self.priors.clone()
-        self.w = value_estimate.item()
+        self.priors = masked_priors.clone()
+        self.original_priors = masked_priors
 
         if self.parent is None:
+            self.add_root_noise()
+
+        self.priors /= self.priors.sum()
+
+        self.edges = [Edge(a, self.priors[a].item()) for a in self.legal_action_ids if self.priors[a] > 0]
+        self.edges.sort(key=lambda edge: edge.prior, reverse=True)
+
+        if config['ai']['zero']['mcts']['batch_children']['enabled']:
+            self.prepare_children(net)
+
+    def evaluate(self, net):
+        """
+        Ask the net (or the net's cache) for the priors of the legal moves and the value of this position
+        The priors are masked to legal moves, but not normalized
+        """
+        return evaluate(net, [self.game], [self.legal_action_ids], self.tree.stats)[0]
+
+    def prepare_children(self, net):
+        """
+        Play out the top_k moves by prior, and evaluate all of the resulting positions in one forward pass
+        Lots of tiny forwards cost far more than one bigger one, mostly in Python and framework overhead
+        The children are still only made into nodes once the search goes there, but their game copies count against the pool
+        """
+        top_k = config['ai']['zero']['mcts']['batch_children']['top_k']
+        stats = self.tree.stats
+
+        edges, games, legal_action_ids = [], [], []
+        for edge in self.edges[:top_k]:
+            if edge.node is not None or is_chance_action(edge.action_id):
+                continue
+
+            with stats.timer('copy'):
+                game = self.game.copy()
+            legal = advance(game, edge.action_id, None, stats)
+            if game.is_finished:
+                continue
+
+            edges.append(edge)
+            games.append(game)
+            legal_action_ids.append(legal)
+
+        if not games:
+            return
+
+        for edge, game, legal, evaluation in zip(edges, games, legal_action_ids, evaluate(net, games, legal_action_ids, stats)):
+            self.tree.pool.prepare(edge, (game, legal, evaluation), parent=self)
+
+    def add_root_noise(self):
+        if self.tree.noise:
             self.add_dirichlet_noise()
 
-        masked_priors = torch.zeros(207)
+        masked_priors = torch.zeros(NUM_UNIQUE_ACTIONS)
         masked_priors[self.legal_action_ids] = self.priors[self.legal_action_ids]
         self.priors = masked_priors
 
+    def become_root(self):
+        """
+        Cut loose from the parent to be the root of a new search, keeping everything learned so far
+        Only the priors change, since the root gets fresh noise
+        """
+        self.parent = None
+
+        self.priors = self.original_priors.clone()
+        self.add_root_noise()
         self.priors /= self.priors.sum()
 
+        for edge in self.edges:
+            edge.prior = self.priors[edge.action_id].item()
+        self.edges.sort(key=lambda edge: edge.prior, reverse=True)
+
     def add_dirichlet_noise(self):
         eps = config['ai']['zero']['dirichlet']['epsilon']
 
@@ -155,19 +428,6 @@ class MCTNode:
 
         torch.add(self.priors * (1 - eps), noise * eps, out=self.priors)
 
-    def backup(self):
-        log.trace(f'node id: {id(self)}', tags=['mcts'])
-
-        val = self.q
-        current = self
-
-        while current.parent is not None:
-            if current.game.current_player.num != current.parent.game.current_player.num:
-                val *= -1
-
-            current = current.parent
-            current.w += val
-
     @staticmethod
     def backup_from_future(fut):
         fut.node.backup()
@@ -204,13 +464,13 @@ a, n, p, q, u:
 {
         np.asarray([
             (
-                i,
-                s.n,
-                self.priors[i].item(),
-                s.q if s.game.current_player.num == self.game.current_player.num else -s.q,
-                (s.q if s.game.current_player.num == self.game.current_player.num else -s.q) + config['ai']['zero']['mcts']['c_puct'] * self.priors[i].item() * np.sqrt(self.n) / (1 + s.n)
+                e.action_id,
+                e.node.n,
+                e.prior,
+                self.child_q(e.node),
+                self.calc_u_for_edge(e, np.sqrt(self.n))
             )
-                for i, s in enumerate(self.children) if isinstance(s, MCTNode)
+                for e in self.edges if e.node is not None
         ])
 }
 
@@ -231,63 +491,260 @@ priors:
 # {s_d}
 
         for node in self.children:
-            if isinstance(node, MCTNode):
-                node.log()
+            node.log()
         log.debug('up')
 
 
-class MCT:
-    expand_count = 0
+class ChanceNode(Node):
+    """
+    The dice (or the development card deck) decide what happens next
 
-    def __init__(self):
-        self.root = None
+    Rather than rolling for real, outcomes are visited in proportion to their probabilities,
+    and q is the probability-weighted average over the outcomes visited so far.
+    The game is the parent's, from just before the chance action.
+    """
+    needs_children = True
+
+    def __init__(self, net, action_id, parent):
+        log.trace(f"id: {id(self)}", tags=['mcts'])
+        super().__init__(parent.game, action_id, parent)
+
+        self.outcomes, self.probabilities = chance_outcomes(self.game, action_id)
+        self.outcome_nodes = [None] * len(self.outcomes)
+
+        # Like any new node, come back with an evaluation
+        child = self.favorite_child(net)
+        child.n = 1
+        if child.game.is_finished:
+            child.backup()
+
+    @property
+    def children(self):
+        return [node for node in self.outcome_nodes if node is not None]
+
+    def detach(self, child):
+        self.outcome_nodes = [None if node is child else node for node in self.outcome_nodes]
+
+    def clear(self):
+        super().clear()
+        self.outcome_nodes = []
+
+    @property
+    def q(self):
+        # An outcome can hand the turn over, e.g. a roll or a draw followed by a forced end_turn (see advance),
+        # so each outcome's q is flipped to this node's point of view like any other child's
+        visited = [(p, self.child_q(s)) for p, s in zip(self.probabilities, self.outcome_nodes) if s is not None]
+        total_p = sum(p for p, _ in visited)
+        if total_p == 0:
+            return super().q
 
-    def search(self, game, net, num_iterations=None):
-        # Reset search stats
-        MCT.expand_count = 0
+        return sum(p * q for p, q in visited) / total_p
 
-        # Start the timer
-        start = timeit.default_timer()
+    def favorite_child(self, net):
+        """
+        Stratified: pick an outcome in proportion to how far behind its share of the visits it is
+        The first pick is an ordinary roll of the dice
+        """
+        self.tree.stats.selections += 1
+        n = sum(s.n for s in self.children) + 1
+        deficits = [max(0, p * n - (s.n if s is not None else 0)) for p, s in zip(self.probabilities, self.outcome_nodes)]
+        i = random.choices(range(len(self.outcomes)), weights=deficits, k=1)[0]
+
+        if self.outcome_nodes[i] is None:
+            log.trace(f"Chance outcome {self.outcomes[i]} is new", tags=['mcts'])
+            self.outcome_nodes[i] = self.tree.pool.acquire(MCTNode, self.game, net, self.action_id, parent=self, outcome=self.outcomes[i])
+
+        return self.outcome_nodes[i]
+
+    def log(self):
+        log.debug(f'''\
+parent id: {id(self.parent)}
+self id: {id(self)}
+chance action id: {self.action_id}
+
+q: {self.q}
+n: {self.n}
+
+outcome, p, n, q:
+{np.asarray([(o, p, s.n, s.q) for o, p, s in zip(self.outcomes, self.probabilities, self.outcome_nodes) if s is not None])}
+''')
+
+        for node in self.children:
+            node.log()
+        log.debug('up')
+
+
+class MCT:
+    def __init__(self):
+        self.root = None
+        self.pool = NodePool()
+        self.stats = SearchStats()
+        self.noise = True
+
+    def search(self, game, net, num_iterations=None, time_budget_s=None, stop=None, reuse=False, early_stop=None, noise=True):
+        """
+        Search until num_iterations are done or time_budget_s runs out, whichever comes first
+        At least one of the two must be given
+        The root is always expanded, no matter how small the budget
+
+        stop - a threading.Event that ends the search early when set
+        reuse - if the current tree already has a node for this position, carry on searching from it
+        early_stop - quit once the visit distribution settles (see should_stop_early). Defaults to the config
+        noise - mix Dirichlet noise into the root priors, to explore during self-play
+        """
+        if num_iterations is None and time_budget_s is None:
+            raise ValueError('MCT.search needs either num_iterations or time_budget_s')
+
+        early_stop_config = config['ai']['zero']['mcts']['early_stop']
+        if early_stop is None:
+            early_stop = early_stop_config['enabled']
+        previous_pi = None
+
+        # Reset search stats, and start the timer
+        self.stats = SearchStats()
+        deadline = self.stats.start + time_budget_s if time_budget_s is not None else None
 
         # Search
-        self.root = MCTNode(game, net)
-        self.root.n = 1
-        if config['ai']['zero']['mcts']['parallel']:
-            wait([self.root.expansion])
+        self.noise = noise
+        root = self.find(game) if reuse else None
+        self.stats.reused_visits = root.n if root is not None else 0
+        if root is not None:
+            self.reroot(root)
+        else:
+            self.pool.release_all()
+            self.root = self.pool.acquire(MCTNode, game, net, tree=self)
+            self.root.n = 1
+            if config['ai']['zero']['mcts']['parallel']:
+                wait([self.root.expansion])
+
+        i = 1
+        while num_iterations is None or i < num_iterations:
+            if deadline is not None and timeit.default_timer() >= deadline:
+                break
+            if stop is not None and stop.is_set():
+                break
+            if early_stop and i >= early_stop_config['min_iterations'] and i % early_stop_config['check_every'] == 0:
+                if should_stop_early(self.root, i, num_iterations, previous_pi):
+                    if num_iterations is not None:
+                        self.stats.saved_iterations = num_iterations - i
+                    break
+                previous_pi = self.root.pi
 
-        for i in range(num_iterations-1):
             log.trace(f'Return to root - iteration {i}', tags=['mcts'])
+            i += 1
 
             current = self.root
             current.n += 1
+            depth = 0
 
             while current.n > 1:
                 current = current.favorite_child(net)
                 current.n += 1
+                depth += 1
 
                 if current.game.is_finished:
                     current.backup()
                     break
 
+            self.stats.depths.append(depth)
+
         # Stop the timer
-        end = timeit.default_timer()
+        self.stats.iterations = i
+        self.stats.finish()
 
         # Log
-        self.log(duration=end-start)
+        self.log(net=net)
 
         return self.pi
 
+    def find(self, game):
+        """
+        Look thru the current tree for a node at the same position as game
+        """
+        if self.root is None or self.root.game is None:
+            return None
+
+        legal_action_ids = get_legal_action_ids(game)
+        state = None
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+
+            if not isinstance(node, MCTNode) or not node.edges:
+                continue
+            if node.game.turn_num != game.turn_num or node.game.current_player.num != game.current_player.num:
+                continue
+            if roll_total(node.game) != roll_total(game) or node.legal_action_ids != legal_action_ids:
+                continue
+
+            state = state if state is not None else GameState(game).tensor
+            if torch.equal(GameState(node.game).tensor, state):
+                return node
+
+        return None
+
+    def reroot(self, node):
+        """
+        Make node the root, and give the rest of the old tree back to the pool
+        """
+        if node is not self.root:
+            node.parent.detach(node)
+            old_root = self.root
+            node.become_root()
+            self.pool.release(old_root)
+        else:
+            node.become_root()
+
+        self.root = node
+
     @property
     def pi(self):
-        return self.root.pi
-
-    def log(self, duration):
-        if config['logging']['categories']['mcts']:
-            np.set_printoptions(linewidth=120, suppress=True, precision=8)
-            torch.set_printoptions(linewidth=120, precision=8, profile='full')
-            log.debug(f'Search Complete\n'
-                      f'Player: {self.root.game.current_player.name} (p{self.root.game.current_player.num})\n'
-                      f'Duration: {duration}s\n'
-                      f'Expand Count: {MCT.expand_count}\n'
-                      f'Duration/Expand: {duration / MCT.expand_count}')
-            self.root.log()
+        # If time ran out before any child was visited, the priors are the best guess available
+        pi = self.root.pi
+        if not pi.any():
+            pi = self.root.priors.numpy()
+
+        return pi
+
+    def summary(self, top_k=None, max_depth=None):
+        """
+        The top_k most visited children of each node, down to max_depth
+        A cheap look at what the search thought, rather than a dump of the whole tree
+        """
+        top_k = top_k or config['ai']['zero']['mcts']['summary']['top_k']
+        max_depth = max_depth or config['ai']['zero']['mcts']['summary']['max_depth']
+
+        lines = []
+        stack = [(child, self.root, 0) for child in self.top_children(self.root, top_k)]
+        while stack:
+            node, parent, depth = stack.pop()
+
+            q = node.q if node.game.current_player.num == parent.game.current_player.num else -node.q
+            outcome = f'/{node.outcome}' if getattr(node, 'outcome', None) is not None else ''
+            prior = next((f' p={edge.prior:.3f}' for edge in getattr(parent, 'edges', []) if edge.node is node), '')
+            lines.append('  ' * depth + f'a={node.action_id}{outcome} n={node.n} q={q:.3f}{prior}')
+
+            if depth + 1 < max_depth:
+                stack += [(child, node, depth + 1) for child in self.top_children(node, top_k)]
+
+        return '\n'.join(lines)
+
+    @staticmethod
+    def top_children(node, top_k):
+        # Most visited last, since they come off the stack first
+        return sorted(node.children, key=lambda s: s.n)[-top_k:]
+
+    def log(self, net):
+        if not config['logging']['categories']['mcts'] or not log.is_enabled_for('debug'):
+            return
+
+        record = self.stats.to_dict(self.root)
+        record['player'] = f'{self.root.game.current_player.name} (p{self.root.game.current_player.num})'
+        record['pool'] = self.pool.stats
+        if net.cache is not None:
+            record['cache'] = net.cache.stats
+
+        log.debug('Search Complete', data=record, tags=['mcts'])
+        log.debug(f'Search Summary\n{self.summary()}', tags=['mcts'])
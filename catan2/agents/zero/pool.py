@@ -0,0 +1,165 @@
+"""
+Node Pool
+
+Every node in a search tree holds its own copy of the Game, so a big search can eat all the memory on a small box.
+The pool counts the live nodes of a tree, and once the cap is hit it frees the least visited subtrees.
+Children evaluated ahead of time (see MCTNode.prepare_children) hold a Game copy too, so they count against the cap,
+and they are the first to go - they have no visits, and only cost a forward pass to redo.
+Freed node objects are kept and reused for the next nodes the tree needs. That only saves making the object -
+each node still makes its own Game copy, and the freed node's copy is left to the garbage collector.
+
+A freed subtree's visits and value are taken back out of its ancestors, so if the search goes there again,
+the new nodes aren't counted on top of the ones that were thrown away.
+"""
+
+from collections import defaultdict
+
+from catan2 import config, log
+
+# Roughly what one node costs, measured with tracemalloc mid-game. Nearly all of it is the Game copy.
+BYTES_PER_NODE = 100 * 1024
+
+
+class NodePool:
+    def __init__(self, max_nodes: int = None, max_mb: float = None):
+        pool_config = config['ai']['zero']['mcts']['pool']
+        max_nodes = max_nodes or pool_config['max_nodes']
+        max_mb = max_mb or pool_config['max_mb']
+
+        caps = [cap for cap in (max_nodes, int(max_mb * 1024 * 1024 / BYTES_PER_NODE) if max_mb else None) if cap]
+        self.max_nodes = min(caps) if caps else None
+        self.evict_fraction = pool_config['evict_fraction']
+
+        self.live = set()
+        self.free = defaultdict(list)
+        self.num_prepared = 0  # edges holding a prepared child
+
+        self.reused = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.live) + self.num_prepared
+
+    def is_full(self):
+        return self.max_nodes is not None and len(self) >= self.max_nodes
+
+    def acquire(self, node_type, *args, parent=None, **kwargs):
+        """
+        Make a node of node_type, reusing a freed one if there is one
+        """
+        if self.is_full():
+            self.evict(protected=parent)
+
+        free = self.free[node_type]
+        if free:
+            node = free.pop()
+            self.reused += 1
+        else:
+            node = node_type.__new__(node_type)
+
+        self.live.add(node)
+        node.__init__(*args, parent=parent, **kwargs)
+
+        return node
+
+    def prepare(self, edge, prepared, parent):
+        """
+        Hang a prepared child, (game, legal action ids, evaluation), on one of parent's edges
+        """
+        if self.is_full():
+            self.evict(protected=parent)
+
+        edge.prepared = prepared
+        self.num_prepared += 1
+
+    def take_prepared(self, edge):
+        """
+        The edge's prepared child, if it has one, to make a node of
+        """
+        prepared, edge.prepared = edge.prepared, None
+        if prepared is not None:
+            self.num_prepared -= 1
+
+        return prepared
+
+    def drop_prepared(self, node):
+        for edge in node.prepared_edges():
+            self.take_prepared(edge)
+
+    def release(self, node):
+        """
+        Free a node and everything below it
+        """
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            stack.extend(current.children)
+
+            self.live.discard(current)
+            self.drop_prepared(current)
+            current.clear()
+            self.free[type(current)].append(current)
+
+    def release_all(self):
+        for node in self.live:
+            node.clear()
+            self.free[type(node)].append(node)
+
+        self.live = set()
+        self.num_prepared = 0
+
+    def evict(self, protected=None):
+        """
+        Free the least visited subtrees until the pool is evict_fraction below its cap
+
+        protected and its ancestors are on the path being searched right now, so they stay.
+        So do the root and its children, which the final pi is read from.
+        A chance node's visits are all its outcomes', so it never outlives them - it goes along with its last one,
+        or, if it has to stay, so does that outcome.
+        """
+        keep = set()
+        while protected is not None:
+            keep.add(protected)
+            protected = protected.parent
+
+        # Prepared children first. Then, if that wasn't enough, whole subtrees
+        target = int(self.max_nodes * (1 - self.evict_fraction))
+        for node in list(self.live):
+            if len(self) <= target:
+                return
+            if node not in keep:
+                self.drop_prepared(node)
+
+        def evictable(node):
+            return node.parent is not None and node.parent.parent is not None and node not in keep
+
+        candidates = sorted((node for node in self.live if evictable(node)), key=lambda node: node.n)
+
+        for node in candidates:
+            if len(self) <= target:
+                break
+            if node not in self.live:  # already freed along with an ancestor
+                continue
+
+            while node.parent.needs_children and node.parent.children == [node]:
+                node = node.parent
+            if not evictable(node):
+                continue
+
+            node.forget()
+            node.parent.detach(node)
+            self.release(node)
+            self.evicted += 1
+
+        if self.is_full():
+            log.warning(f'Node pool could not get under its cap of {self.max_nodes} nodes', tags=['mcts'])
+
+    @property
+    def stats(self):
+        return {
+            'live': len(self.live),
+            'prepared': self.num_prepared,
+            'free': sum(len(free) for free in self.free.values()),
+            'reused': self.reused,
+            'evicted_subtrees': self.evicted
+        }
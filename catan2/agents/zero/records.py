@@ -0,0 +1,146 @@
+"""
+Game Records
+
+Samples stored as the game they came from, rather than as tensors. One JSON line per game:
+    seed            the game's random seed - the board, the deck, the seating and every roll follow from it
+    is_random       whether the board was shuffled
+    num_players
+    actions         every action id taken in the game, in order
+    samples         [move, policy_ids, policy_probs, value] per searched move, where move is how many actions came before it
+Replaying the actions regenerates each sample's GameState, so the encoding can change without searching all over again.
+A game of a few hundred actions takes a few KB, where its samples as tensors take hundreds of KB.
+
+Every writer appends to its own records_<token>.jsonl, so several sampling processes can share a directory.
+"""
+
+import json
+import os
+import uuid
+
+import torch
+
+from catan2.agents import Agent
+from catan2.constants import NUM_UNIQUE_ACTIONS
+
+from .gamestate import GameState
+
+PREFIX = 'records'
+
+
+def record_files(directory: str):
+    return sorted(f for f in os.listdir(directory) if f.startswith(PREFIX) and f.endswith('.jsonl'))
+
+
+def has_records(directory: str):
+    return os.path.isdir(directory) and len(record_files(directory)) > 0
+
+
+def read_records(directory: str):
+    records = []
+    for filename in record_files(directory):
+        with open(os.path.join(directory, filename)) as f:
+            records += [json.loads(line) for line in f if line.strip()]
+
+    return records
+
+
+def make_record(game, samples: [(int, [float], int)]):
+    """
+    samples - (move, pi, value) for each searched move
+    """
+    record_samples = []
+    for move, pi, value in samples:
+        policy_ids = [i for i, p in enumerate(pi) if p > 0]
+        record_samples.append([move, policy_ids, [round(float(pi[i]), 5) for i in policy_ids], value])
+
+    return {
+        'seed': game.seed,
+        'is_random': game.is_random,
+        'num_players': len(game.players),
+        'actions': game.actions,
+        'samples': record_samples
+    }
+
+
+class RecordWriter:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        # Unique to this writer, so writers in other processes never append to the same file
+        self.filename = os.path.join(directory, f'{PREFIX}_{uuid.uuid4().hex[:12]}.jsonl')
+        self.num_records = 0
+
+    def add(self, game, samples: [(int, [float], int)]):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(make_record(game, samples)) + '\n')
+
+        self.num_records += 1
+
+
+class Replayer(Agent):
+    """
+    Sits in for the original players while a game is replayed. Every move is already decided
+    """
+
+    def choose_action(self):
+        raise Exception('A replayed game has no decisions to make')
+
+
+def positions(record: dict):
+    """
+    Play a recorded game over again, stopping at each of its samples to yield (game, pi, v)
+    The game moves on once the next one is asked for, so encode it before then
+    """
+    # Imported here because the game imports the agents, Zero among them
+    from catan2.catan.actions import get_action_by_id
+    from catan2.catan.game import Game
+
+    game = Game(
+        agents=[Replayer() for _ in range(record['num_players'])],
+        is_random=record['is_random'],
+        game_seed=record['seed']
+    )
+
+    samples = iter(record['samples'])
+    sample = next(samples, None)
+    for move, action_id in enumerate(record['actions']):
+        while sample is not None and sample[0] == move:
+            _, policy_ids, policy_probs, value = sample
+            pi = torch.zeros(NUM_UNIQUE_ACTIONS)
+            pi[policy_ids] = torch.tensor(policy_probs)
+
+            yield game, pi, torch.as_tensor(value, dtype=torch.short)
+            sample = next(samples, None)
+
+        func, args, kwargs = get_action_by_id(game, action_id)
+        func(*args, **kwargs)
+
+
+def replay(record: dict):
+    """
+    Yield (state, pi, v) for each of a recorded game's samples, as training wants them
+    """
+    for game, pi, value in positions(record):
+        yield GameState.batch([game], on_device=False)[0], pi, value
+
+
+def replay_together(records: [dict]):
+    """
+    Replay several games side by side, encoding the next position of all of them in one batch
+    """
+    replays = [positions(record) for record in records]
+    while replays:
+        current = [(replay, next(replay, None)) for replay in replays]
+        current = [(replay, position) for replay, position in current if position is not None]
+        if not current:
+            return
+
+        replays = [replay for replay, _ in current]
+        states = GameState.batch([position[0] for _, position in current], on_device=False)
+        for state, (_, (_, pi, value)) in zip(states, current):
+            yield state, pi, value
+
+
+def num_samples(records: [dict]):
+    return sum(len(record['samples']) for record in records)
@@ -0,0 +1,90 @@
+"""
+Replay Buffer
+
+The most recent self-play samples, kept in preallocated tensors so training can draw real minibatches.
+Once it's full, the newest samples write over the oldest, so the buffer is a window over the last few generations.
+
+Policies are kept the way compact.py keeps them, as the visited action ids and their probabilities,
+padded out to policy_top_k per sample (id 0 with probability 0). That's 4 bytes per slot, ~128 bytes at 32,
+against 414 for a dense float16 row of 207.
+A sample that visited more actions than that keeps its policy_top_k most visited, renormalized.
+"""
+
+import torch
+
+from catan2 import config
+from catan2.constants import BOARD_WIDTH, NUM_UNIQUE_ACTIONS
+
+from .cnn import NUM_GAME_LAYERS
+from .compact import as_compact
+from .device import device
+from .symmetry import Symmetries
+
+
+class ReplayBuffer:
+    def __init__(self, capacity: int = None, policy_top_k: int = None):
+        replay_config = config['ai']['zero']['replay']
+        self.capacity = capacity or replay_config['capacity']
+        self.policy_top_k = policy_top_k or replay_config['policy_top_k']
+
+        # Stored as compactly as the samples come in (see compact.py), and decoded a minibatch at a time
+        self.states = torch.empty((self.capacity, NUM_GAME_LAYERS, BOARD_WIDTH, BOARD_WIDTH), dtype=torch.uint8)
+        self.policy_ids = torch.zeros((self.capacity, self.policy_top_k), dtype=torch.int16)
+        self.policy_probs = torch.zeros((self.capacity, self.policy_top_k), dtype=torch.float16)
+        self.values = torch.empty(self.capacity, dtype=torch.int8)
+
+        self.next = 0  # where the next sample goes
+        self.size = 0
+        self.truncated = 0  # samples that had more visited actions than policy_top_k
+
+    def __len__(self):
+        return self.size
+
+    def add(self, samples: [(torch.tensor, torch.tensor, torch.tensor, torch.tensor)]):
+        """
+        samples - cooked samples
+        """
+        for state, policy_ids, policy_probs, value in map(as_compact, samples):
+            if len(policy_ids) > self.policy_top_k:
+                policy_probs, top = policy_probs.float().topk(self.policy_top_k)
+                policy_ids = policy_ids[top]
+                policy_probs = (policy_probs / policy_probs.sum()).half()
+                self.truncated += 1
+
+            k = len(policy_ids)
+            self.states[self.next] = state
+            self.policy_ids[self.next, :k] = policy_ids
+            self.policy_ids[self.next, k:] = 0
+            self.policy_probs[self.next, :k] = policy_probs
+            self.policy_probs[self.next, k:] = 0
+            self.values[self.next] = value
+
+            self.next = (self.next + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size: int = None):
+        """
+        A minibatch drawn uniformly, with replacement, from everything in the buffer
+        """
+        batch_size = batch_size or config['ai']['batch_size']
+        i = torch.randint(self.size, (batch_size,))
+        states = self.states[i]
+        policies = torch.zeros((batch_size, NUM_UNIQUE_ACTIONS)).scatter_add_(1, self.policy_ids[i].long(), self.policy_probs[i].float())
+        if config['ai']['zero']['samples']['augment']['enabled']:
+            states, policies = Symmetries.standard().augment(states, policies)
+
+        return (
+            states.to(device, torch.long),
+            policies.to(device),
+            self.values[i].to(device, torch.short)
+        )
+
+    def batches(self, batch_size: int = None, num_batches: int = None):
+        """
+        Enough minibatches to see about as many samples as the buffer holds, unless num_batches says otherwise
+        """
+        batch_size = batch_size or config['ai']['batch_size']
+        num_batches = num_batches or max(1, self.size // batch_size)
+
+        for _ in range(num_batches):
+            yield self.sample(batch_size)
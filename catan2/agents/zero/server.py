@@ -0,0 +1,152 @@
+"""
+Inference Server
+
+One process owns the net, and many self-play processes ask it for evaluations.
+Requests are batched up to a size or a timeout, whichever comes first.
+
+Everything goes thru torch.multiprocessing queues, so tensors travel in shared memory.
+This is for one Linux box - processes are forked, and nothing touches the network.
+
+CUDA can't be set up again in a forked process, so with ai.gpu on, the process that forks the server and the workers
+must not have touched the GPU yet. That is why Zero.main_net is only made on first use, and why the server is handed
+its weights on the CPU.
+"""
+
+import queue
+import timeit
+
+import torch
+import torch.multiprocessing as mp
+
+from catan2 import config, log
+
+from .cache import EvalCache
+from .cnn import CNN
+from .compiled import CompiledNet
+from .device import device
+from .gamestate import GameState
+
+ctx = mp.get_context('fork')
+
+
+class InferenceClient:
+    """
+    Stands in for a CNN inside of a worker process
+    Call it like a net: client(state) -> (priors, value)
+    """
+
+    def __init__(self, worker_id: int, requests: mp.Queue, responses: mp.Queue):
+        self.worker_id = worker_id
+        self.requests = requests
+        self.responses = responses
+
+        # The server's weights don't change while workers are running
+        self.version = 0
+        self.cache = EvalCache() if config['ai']['zero']['cache']['enabled'] else None
+
+    def __call__(self, state):
+        # Batches go over as separate requests. The server answers one worker's requests in order
+        states = state.cpu().view(-1, *state.shape[-3:])
+        for s in states:
+            self.requests.put((self.worker_id, s))
+        responses = [self.responses.get() for _ in states]
+
+        priors = torch.stack([priors for priors, _ in responses])
+        values = torch.stack([value for _, value in responses])
+
+        return priors.view(len(states), -1), values.view(len(states), 1)
+
+
+class InferenceServer:
+    def __init__(self, net: CNN, num_workers: int, batch_size: int = None, timeout_s: float = None):
+        self.batch_size = batch_size or config['ai']['zero']['server']['batch_size']
+        self.timeout_s = timeout_s if timeout_s is not None else config['ai']['zero']['server']['timeout_ms'] / 1000
+
+        self.requests = ctx.Queue()
+        self.responses = [ctx.Queue() for _ in range(num_workers)]
+
+        self.process = ctx.Process(
+            target=serve,
+            args=(net.state_dict(), self.requests, self.responses, self.batch_size, self.timeout_s),
+            daemon=True
+        )
+
+    def client(self, worker_id: int):
+        return InferenceClient(worker_id, self.requests, self.responses[worker_id])
+
+    def start(self):
+        if device.type == 'cuda' and torch.cuda.is_initialized():
+            raise Exception('CUDA is already in use in this process, so a forked inference server could not use it')
+
+        self.process.start()
+        return self
+
+    def stop(self):
+        self.requests.put(None)
+        self.process.join()
+
+
+def next_batch(requests: mp.Queue, batch_size: int, timeout_s: float):
+    """
+    Block until there is at least one request, then collect more until the batch is full or time runs out
+    A None in the batch means it is time to shut down
+    """
+    batch = [requests.get()]
+    deadline = timeit.default_timer() + timeout_s
+
+    while len(batch) < batch_size and batch[-1] is not None:
+        remaining = deadline - timeit.default_timer()
+        if remaining <= 0:
+            break
+
+        try:
+            batch.append(requests.get(timeout=remaining))
+        except queue.Empty:
+            break
+
+    return batch
+
+
+def serve(state_dict, requests: mp.Queue, responses: [mp.Queue], batch_size: int, timeout_s: float):
+    # Batches mix states from different games, so BatchNorm has to use its running statistics
+    net = CNN().to(device)
+    net.load_state_dict(state_dict)
+    net.eval()
+    # Only self-play workers ask the server, so they get the int8 copy if self-play is meant to use one
+    quantize = config['ai']['zero']['quantized']['enabled']
+    if (config['ai']['zero']['compiled']['enabled'] or quantize) and device.type == 'cpu':
+        net = CompiledNet(net, quantize=quantize)
+
+    # Every batch is stacked into the same block of memory
+    inputs = GameState.empty(batch_size)
+
+    num_batches = 0
+    num_states = 0
+    running = True
+
+    while running:
+        batch = next_batch(requests, batch_size, timeout_s)
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+
+        if not batch:
+            continue
+
+        worker_ids, states = zip(*batch)
+        with torch.no_grad():
+            priors, values = net(torch.stack(states, out=inputs[:len(states)]).to(device))
+
+        priors = priors.cpu()
+        values = values.cpu()
+        for i, worker_id in enumerate(worker_ids):
+            responses[worker_id].put((priors[i].clone(), values[i].clone()))
+
+        num_batches += 1
+        num_states += len(batch)
+
+    log.info('Inference server stopped', data={
+        'batches': num_batches,
+        'states': num_states,
+        'mean_batch_size': num_states / num_batches if num_batches else 0
+    }, tags=['infra'])
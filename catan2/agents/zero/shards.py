@@ -0,0 +1,175 @@
+"""
+Sample Shards
+
+Samples on disk as plain .npy arrays that can be memory-mapped, rather than pickled lists of tensors.
+A shard is a handful of arrays over the same samples:
+    states          [n, layers, width, width]   uint8
+    values          [n]                         int8
+    meta            [n, 2]                      int32 (game id, move number within the game)
+    policy_offsets  [n + 1]                     int64
+    policy_ids      [offsets[-1]]               int16
+    policy_probs    [offsets[-1]]               float16
+The same encoding as compact.py, with the policies laid end to end.
+The policy is sparse: sample i's non-zero entries are ids/probs[offsets[i]:offsets[i + 1]].
+
+manifest.jsonl lists one shard per line with its size. Every writer only ever appends a line,
+so several sampling processes can share a directory.
+"""
+
+import bisect
+import json
+import os
+import uuid
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from catan2 import config
+from catan2.constants import NUM_UNIQUE_ACTIONS
+
+from .compact import as_compact
+
+MANIFEST = 'manifest.jsonl'
+ARRAYS = ['states', 'values', 'meta', 'policy_offsets', 'policy_ids', 'policy_probs']
+
+
+def shard_path(directory: str, name: str, array: str):
+    return os.path.join(directory, f'{name}.{array}.npy')
+
+
+def read_manifest(directory: str):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def has_manifest(directory: str):
+    return os.path.exists(os.path.join(directory, MANIFEST))
+
+
+class ShardWriter:
+    def __init__(self, directory: str, prefix: str = 'shard', shard_size: int = None):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size or config['ai']['zero']['samples']['shard_size']
+
+        # Unique to this writer, so writers in other processes (or earlier in this one) never reuse a name
+        self.token = uuid.uuid4().hex[:12]
+        self.num_shards = 0
+        self._pending = []
+
+    def add(self, samples: [(torch.tensor, torch.tensor, torch.tensor, torch.tensor)], game_id: int):
+        """
+        samples - one game's cooked samples
+        """
+        for move, sample in enumerate(samples):
+            self._pending.append((game_id, move, as_compact(sample)))
+
+        if len(self._pending) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{self.prefix}_{self.token}_{self.num_shards:05d}'
+        n = len(self._pending)
+
+        samples = [sample for _, _, sample in self._pending]
+        states = np.stack([state.numpy() for state, _, _, _ in samples])
+        values = np.array([int(value) for _, _, _, value in samples], dtype=np.int8)
+        meta = np.array([(game_id, move) for game_id, move, _ in self._pending], dtype=np.int32).reshape(n, 2)
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ids) for _, ids, _, _ in samples])
+        policy_ids = np.concatenate([ids.numpy() for _, ids, _, _ in samples])
+        policy_probs = np.concatenate([probs.numpy() for _, _, probs, _ in samples])
+
+        for array, data in zip(ARRAYS, [states, values, meta, offsets, policy_ids, policy_probs]):
+            np.save(shard_path(self.directory, name, array), data)
+
+        # One short line in append mode, so concurrent writers don't clobber each other
+        with open(os.path.join(self.directory, MANIFEST), 'a') as f:
+            f.write(json.dumps({'name': name, 'size': n}) + '\n')
+
+        self.num_shards += 1
+        self._pending = []
+
+
+class Shard:
+    """
+    One shard's arrays, memory-mapped on first use
+    """
+
+    def __init__(self, directory: str, name: str, size: int):
+        self.directory = directory
+        self.name = name
+        self.size = size
+        self._arrays = None
+
+    def __len__(self):
+        return self.size
+
+    def __getattr__(self, array):
+        if array not in ARRAYS:
+            raise AttributeError(array)
+
+        if self._arrays is None:
+            self._arrays = {a: np.load(shard_path(self.directory, self.name, a), mmap_mode='r') for a in ARRAYS}
+
+        return self._arrays[array]
+
+    def load(self):
+        """
+        Read the whole shard into memory, for streaming thru it start to finish
+        """
+        self._arrays = {a: np.load(shard_path(self.directory, self.name, a)) for a in ARRAYS}
+        return self
+
+    def policy(self, i: int):
+        start, end = self.policy_offsets[i], self.policy_offsets[i + 1]
+        pi = np.zeros(NUM_UNIQUE_ACTIONS, dtype=np.float32)
+        pi[self.policy_ids[start:end]] = self.policy_probs[start:end]
+        return pi
+
+    def __getitem__(self, i: int):
+        return (
+            torch.as_tensor(np.array(self.states[i], dtype=np.int64)),
+            torch.as_tensor(self.policy(i)),
+            torch.as_tensor(int(self.values[i]), dtype=torch.short)
+        )
+
+
+class ShardDataset(Dataset):
+    """
+    Every sample in a shard directory, by index. Nothing is read until it's asked for
+    """
+
+    def __init__(self, directory: str):
+        self.shards = [Shard(directory, entry['name'], entry['size']) for entry in read_manifest(directory)]
+
+        self.starts = [0]
+        for shard in self.shards:
+            self.starts.append(self.starts[-1] + len(shard))
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+        s = bisect.bisect_right(self.starts, index) - 1
+        return self.shards[s][index - self.starts[s]]
+
+
+def convert(torch_dir: str, shard_dir: str, shard_size: int = None):
+    """
+    Rewrite a directory of torch.save'd sample files (one per game) as shards
+    """
+    writer = ShardWriter(shard_dir, shard_size=shard_size)
+    for game_id, filename in enumerate(sorted(os.listdir(torch_dir))):
+        writer.add(torch.load(os.path.join(torch_dir, filename)), game_id)
+    writer.flush()
+
+    return writer.num_shards
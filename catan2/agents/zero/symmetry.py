@@ -0,0 +1,151 @@
+"""
+Board Symmetries
+
+The hexagonal board looks the same after a rotation by 60 degrees, (q, r) -> (-r, q + r), or a mirror, (q, r) -> (r, q),
+about its center - 12 symmetries in all, counting the identity. Hexes turn about the center hex (2, 2),
+and points about (6, 6), since a point's coordinates are 3x those of the hexes around it.
+The resources and numbers move with the board, so a transformed sample is a real position on a rotated or mirrored board.
+
+Each symmetry is two gather tables:
+    cells       [width * width]         which cell of a GameState plane each cell is read from
+    actions     [NUM_UNIQUE_ACTIONS]    which action id each action id's probability is read from
+Only the symmetries that carry the board's hexes, points and lanes onto themselves are kept.
+A layout with no center hex to turn about (e.g. an even width) gets empty tables.
+"""
+
+import torch
+from torch.utils.data import default_collate
+
+from catan2.constants import BOARD_WIDTH, NUM_UNIQUE_ACTIONS
+
+
+def rotate(q: int, r: int):
+    return -r, q + r
+
+
+def mirror(q: int, r: int):
+    return r, q
+
+
+def transform(q: int, r: int, num_rotations: int, mirrored: bool, center: int):
+    q, r = q - center, r - center
+    if mirrored:
+        q, r = mirror(q, r)
+    for _ in range(num_rotations):
+        q, r = rotate(q, r)
+
+    return q + center, r + center
+
+
+class Symmetries:
+    _standard = None  # The board never changes, so its tables are only made once
+
+    def __init__(self, board):
+        self.width = board.width
+        center = board.width // 2
+
+        cells = []
+        actions = []
+        for mirrored in (False, True):
+            for num_rotations in range(6):
+                if num_rotations == 0 and not mirrored:
+                    continue
+
+                tables = self.make_tables(
+                    board,
+                    lambda q, r: transform(q, r, num_rotations, mirrored, center),
+                    lambda q, r: transform(q, r, num_rotations, mirrored, 3 * center)
+                ) if board.width % 2 == 1 else None
+
+                if tables is not None:
+                    cells.append(tables[0])
+                    actions.append(tables[1])
+
+        self.cells = torch.tensor(cells, dtype=torch.long).view(-1, self.width * self.width)
+        self.actions = torch.tensor(actions, dtype=torch.long).view(-1, NUM_UNIQUE_ACTIONS)
+
+        # The identity goes first, so the original orientation gets drawn as often as any other
+        self._cells = torch.cat((torch.arange(self.width * self.width).unsqueeze(0), self.cells))
+        self._actions = torch.cat((torch.arange(NUM_UNIQUE_ACTIONS).unsqueeze(0), self.actions))
+
+    def __len__(self):
+        return len(self.cells)
+
+    @staticmethod
+    def make_tables(board, move_hex, move_point):
+        """
+        None if moving the hexes, points and lanes this way doesn't give back the same board
+        """
+        hexes = {(h.q, h.r) for h in board.hexes}
+        if {move_hex(*h) for h in hexes} != hexes:
+            return None
+
+        point_ids = {(point.q, point.r): k for k, point in enumerate(board.points)}
+        if any(move_point(*p) not in point_ids for p in point_ids):
+            return None
+
+        lane_ids = {frozenset((p.q, p.r) for p in lane.points): k for k, lane in enumerate(board.lanes)}
+        moved_lanes = {k: frozenset(move_point(*p) for p in lane) for lane, k in lane_ids.items()}
+        if any(lane not in lane_ids for lane in moved_lanes.values()):
+            return None
+
+        cells = list(range(board.width * board.width))
+        for q, r in hexes:
+            moved_q, moved_r = move_hex(q, r)
+            cells[moved_q * board.width + moved_r] = q * board.width + r
+
+        # Laid out as in actions.py. Everything besides roads, settlements and cities stays put
+        road_start = 7
+        settlement_start = road_start + len(board.lanes)
+        city_start = settlement_start + len(board.points)
+
+        actions = list(range(NUM_UNIQUE_ACTIONS))
+        for k, lane in moved_lanes.items():
+            actions[road_start + lane_ids[lane]] = road_start + k
+        for p, k in point_ids.items():
+            moved = point_ids[move_point(*p)]
+            actions[settlement_start + moved] = settlement_start + k
+            actions[city_start + moved] = city_start + k
+
+        return cells, actions
+
+    def apply(self, states: torch.tensor, pis: torch.tensor, symmetry_ids: torch.tensor):
+        """
+        states          [n, layers, width, width]
+        pis             [n, NUM_UNIQUE_ACTIONS]
+        symmetry_ids    [n] - 0 is the identity, k is self.cells[k - 1]
+        """
+        n, num_layers = states.shape[:2]
+        cells = self._cells[symmetry_ids].to(states.device).unsqueeze(1).expand(n, num_layers, -1)
+        states = states.reshape(n, num_layers, -1).gather(2, cells).view(states.shape)
+        pis = pis.gather(1, self._actions[symmetry_ids].to(pis.device))
+
+        return states, pis
+
+    def augment(self, states: torch.tensor, pis: torch.tensor):
+        """
+        A batch with every sample turned by a random symmetry, or left as it is
+        """
+        if len(self) == 0:
+            return states, pis
+
+        return self.apply(states, pis, torch.randint(len(self) + 1, (len(states),)))
+
+    @staticmethod
+    def standard():
+        if Symmetries._standard is None:
+            # Imported here because catan2.catan imports the game, which imports the agents, Zero among them
+            from catan2.catan.board import Board
+            Symmetries._standard = Symmetries(Board(None, width=BOARD_WIDTH))
+
+        return Symmetries._standard
+
+
+def augment_collate(batch):
+    """
+    DataLoader collate_fn - the default collate, then a random symmetry per sample
+    """
+    states, pis, values = default_collate(batch)
+    states, pis = Symmetries.standard().augment(states, pis)
+
+    return states, pis, values
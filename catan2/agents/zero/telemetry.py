@@ -0,0 +1,101 @@
+"""
+Search Telemetry
+
+Counters and timers for a single MCT.search, boiled down to one compact record at the end.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import timeit
+
+import numpy as np
+
+
+class SearchStats:
+    def __init__(self):
+        self.iterations = 0
+        self.selections = 0
+        self.expansions = 0
+        self.forced_moves = 0
+        self.cache_hits = 0
+        self.reused_visits = 0
+        self.saved_iterations = 0
+
+        self.eval_latencies = []
+        self.batch_sizes = []
+        self.depths = []
+
+        # Positions valued some other way than by the net, by evaluator (heuristic, rollout)
+        self.other_evals = defaultdict(int)
+
+        # copy, legality, encode, nn, heuristic, rollout ...
+        self.timers = defaultdict(float)
+
+        self.start = timeit.default_timer()
+        self.duration = None
+
+    @contextmanager
+    def timer(self, name):
+        start = timeit.default_timer()
+        yield
+        self.timers[name] += timeit.default_timer() - start
+
+    def record_eval(self, latency_s, batch_size=1):
+        self.eval_latencies.append(latency_s)
+        self.batch_sizes.append(batch_size)
+
+    def record_other_eval(self, name, duration_s, num_positions=1):
+        """
+        Evaluations that never touch the net, kept out of the nn_ figures
+        """
+        self.other_evals[name] += num_positions
+        self.timers[name] += duration_s
+
+    def finish(self):
+        self.duration = timeit.default_timer() - self.start
+
+    @staticmethod
+    def branching(root):
+        """
+        Mean number of children actually visited, over every node that has any
+        """
+        counts = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            children = node.children
+            if children:
+                counts.append(len(children))
+                stack.extend(children)
+
+        return float(np.mean(counts)) if counts else 0.0
+
+    def to_dict(self, root=None):
+        duration = self.duration or (timeit.default_timer() - self.start)
+        latencies_ms = np.asarray(self.eval_latencies) * 1000
+
+        record = {
+            'duration_s': round(duration, 4),
+            'iterations': self.iterations,
+            'selections': self.selections,
+            'expansions': self.expansions,
+            'nodes_per_s': round(self.expansions / duration, 1) if duration else 0,
+            'forced_moves': self.forced_moves,
+            'cache_hits': self.cache_hits,
+            'reused_visits': self.reused_visits,
+            'saved_iterations': self.saved_iterations,
+            'nn_calls': len(self.eval_latencies),
+            'nn_mean_batch': round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0,
+            'nn_latency_ms': {
+                f'p{p}': round(float(v), 3) for p, v in zip((50, 90, 99), np.percentile(latencies_ms, (50, 90, 99)))
+            } if len(latencies_ms) else {},
+            'other_evals': dict(self.other_evals),
+            'depth_max': max(self.depths) if self.depths else 0,
+            'depth_mean': round(float(np.mean(self.depths)), 2) if self.depths else 0,
+            'time_s': {name: round(t, 4) for name, t in self.timers.items()}
+        }
+
+        if root is not None:
+            record['branching'] = round(self.branching(root), 2)
+
+        return record
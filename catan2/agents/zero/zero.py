@@ -3,6 +3,7 @@ An Agent Named Zero
 """
 
 import random
+import threading
 import timeit
 import torch
 
@@ -13,10 +14,17 @@ from catan2.catan.player import Player
 from catan2.constants import NUM_UNIQUE_ACTIONS
 
 from .cnn import CNN
+from .compact import encode
 from .data import CatanDataLoader
 from .device import device
+from .distill import distill, make_student
+from .evaluator import get_evaluator
 from .gamestate import GameState
 from .mcts import MCT
+from .records import RecordWriter
+from .replay import ReplayBuffer
+from .shards import ShardWriter
+from .server import InferenceClient
 
 
 def even_pi(game):
@@ -30,44 +38,222 @@ class Zero(Agent):
     Zero chooses a move based off of a Monte Carlo Tree Search, using a CNN to represent game states
     similar to the approach taken by DeepMind's AlphaZero
     """
-    raw_samples: [(GameState, [float])] = []
-    cooked_samples: [(torch.tensor, torch.tensor, torch.tensor)]
+    raw_samples: [(torch.tensor, [float], Player, int)] = []
+    cooked_samples: [(torch.tensor, torch.tensor, torch.tensor, torch.tensor)]  # compact, see compact.py
     threshold = .55
-    _net: CNN = CNN().to(device)
-
-    def __init__(self, name: str = None, net_version: int = None):
+    _net: CNN = None
+    _student: CNN = None
+    _replay: ReplayBuffer = None
+    _shard_writer: ShardWriter = None
+    _record_writer: RecordWriter = None
+
+    def __init__(self, name: str = None, net_version: int = None, client: InferenceClient = None, self_play: bool = False,
+                 evaluator: str = None, student: bool = False):
         super().__init__(name)
+        self.self_play = self_play
         self.net = None
         self.mct = MCT()
         self.mcts_iterations = config['ai']['zero']['mcts']['iterations']
-
-        if net_version is not None:
+        self.time_per_move_s = config['ai']['zero']['mcts']['time_per_move_s']
+        self.time_bank_s = config['ai']['zero']['mcts']['time_bank_s']
+        self.time_bank_moves = config['ai']['zero']['mcts']['time_bank_moves']
+
+        # Search time left for the game currently being played, and how many moves have drawn on it
+        self._bank_game = None
+        self._bank_remaining_s = None
+        self._bank_moves = 0
+
+        # Background search while a human takes their turn
+        self._ponder_thread = None
+        self._ponder_stop = None
+        self.ponders = 0
+        self.ponder_reuses = 0
+
+        # Iterations early stopping saved, one entry per searched move
+        self.saved_iterations = []
+
+        # Playout cap randomization - only self-play searches get capped
+        self.full_searches = 0
+        self.fast_searches = 0
+
+        # Resignation - only in self-play. Some games are played out anyway, to check it was right to resign
+        self._resign_game = None
+        self._resign_allowed = False
+        self._hopeless_moves = 0
+        self.would_have_resigned = False
+
+        if client is not None:
+            self.net = client
+        elif student:
+            if Zero._student is None:
+                raise Exception('There is no student net. Run Zero.distill or Zero.load_student first.')
+            self.net = Zero._student
+            self._name += '_student'
+        elif net_version is not None:
             self._load(net_version)
         else:
             self.net = CNN().to(device)
 
+        # What the search asks about positions. Training always uses the float net
+        self.evaluator = get_evaluator(self.net, evaluator, self_play)
+
         log.trace(message=f"A new instance of Zero ({self.name}) has been created")
 
     def choose_action(self):
-        if self.mcts_iterations > 0:
-            pi = self.mct.search(self.game, self.net, self.mcts_iterations)
+        pondered = self.stop_pondering()
+        time_budget_s = self.time_budget_s()
+        full_search = self.full_search()
+
+        if not full_search:
+            # A quick look to keep the game moving. Too shallow to learn from, so no noise and no sample
+            pi = self.mct.search(self.game, self.evaluator, config['ai']['zero']['mcts']['playout_cap']['fast_iterations'], noise=False)
+        elif time_budget_s is not None:
+            start = timeit.default_timer()
+            pi = self.mct.search(self.game, self.evaluator, time_budget_s=time_budget_s, reuse=pondered)
+            self._bank_remaining_s -= timeit.default_timer() - start
+            self._bank_moves += 1
+        elif self.mcts_iterations > 0:
+            pi = self.mct.search(self.game, self.evaluator, self.mcts_iterations, reuse=pondered)
         else:
             pi = even_pi(self.game)
+
+        if pondered and self.mct.stats.reused_visits:
+            self.ponder_reuses += 1
+        if self.should_resign():
+            log.debug(message=f"{self.name} resigned")
+            return self.player.resign, [], {}
+        if full_search and (time_budget_s is not None or self.mcts_iterations > 0):
+            self.saved_iterations.append(self.mct.stats.saved_iterations)
         action_id = random.choices(population=range(len(pi)), weights=pi, k=1)[0]
 
-        self.raw_samples.append((
-            GameState(self.game).tensor,
-            pi,
-            self.game.current_player
-        ))
+        if full_search:
+            self.raw_samples.append((
+                GameState(self.game).tensor,
+                pi,
+                self.game.current_player,
+                len(self.game.actions)
+            ))
 
         log.debug(message=f"{self.name} chose action id {action_id}")
 
         return get_action_by_id(self.game, action_id)
 
+    def full_search(self):
+        """
+        Whether this move gets the full search budget (and is kept as a training sample)
+        With playout cap randomization, self-play only does a full search on a random fraction of moves
+        """
+        playout_cap = config['ai']['zero']['mcts']['playout_cap']
+        if not self.self_play or not playout_cap['enabled']:
+            return True
+
+        full_search = random.random() < playout_cap['full_probability']
+        if full_search:
+            self.full_searches += 1
+        else:
+            self.fast_searches += 1
+
+        return full_search
+
+    def should_resign(self):
+        """
+        Resign once the root value has been below -threshold for consecutive_moves moves in a row
+        In a played-out game, just remember that we would have
+        """
+        resign = config['ai']['zero']['resign']
+        if not self.self_play or not resign['enabled'] or self.mct.root is None or self.game.is_setup_phase():
+            return False
+
+        if self._resign_game is not self.game:
+            self._resign_game = self.game
+            self._resign_allowed = random.random() >= resign['playout_fraction']
+            self._hopeless_moves = 0
+            self.would_have_resigned = False
+
+        if self.mct.root.q < -resign['threshold']:
+            self._hopeless_moves += 1
+        else:
+            self._hopeless_moves = 0
+
+        if self._hopeless_moves < resign['consecutive_moves']:
+            return False
+
+        if self._resign_allowed:
+            return True
+
+        self.would_have_resigned = True
+        return False
+
+    def ponder(self):
+        """
+        Search from the human's position on a background thread, until it's Zero's turn again
+        If the search gets to the position the human leaves behind, choose_action picks up from there
+        """
+        if not config['ai']['zero']['ponder']['enabled'] or self._ponder_thread is not None:
+            return
+
+        # Copy now - the human is about to change the real game
+        game = self.game.copy()
+
+        self._ponder_stop = threading.Event()
+        self._ponder_thread = threading.Thread(
+            target=self.mct.search,
+            args=(game, self.evaluator, config['ai']['zero']['ponder']['max_iterations']),
+            kwargs={'stop': self._ponder_stop, 'early_stop': False},
+            daemon=True
+        )
+        self._ponder_thread.start()
+        self.ponders += 1
+
+    def game_over(self):
+        # A human's move can end the game, and a ponder search left running would go on to max_iterations
+        self.stop_pondering()
+
+        if self.ponders:
+            log.info('Pondering', data={
+                'agent': self.name,
+                'ponders': self.ponders,
+                'ponder_reuses': self.ponder_reuses
+            }, tags=['game'])
+
+    def stop_pondering(self):
+        """
+        Returns whether there was a ponder search to stop
+        """
+        if self._ponder_thread is None:
+            return False
+
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+
+        return True
+
+    def time_budget_s(self):
+        """
+        How long the next search may take, or None to search by iteration count
+        With a time bank, each move gets an even share of what is left over the moves the game is still expected to last
+        (time_bank_moves of them in all), but never more than time_per_move_s
+        """
+        if self.time_per_move_s is None and self.time_bank_s is None:
+            return None
+
+        if self._bank_game is not self.game:
+            self._bank_game = self.game
+            self._bank_remaining_s = self.time_bank_s if self.time_bank_s is not None else float('inf')
+            self._bank_moves = 0
+
+        if self.time_bank_s is None:
+            return self.time_per_move_s
+
+        # A game that runs long keeps getting a share of what is left, rather than all of it
+        remaining_moves = max(self.time_bank_moves - self._bank_moves, self.time_bank_moves // 4, 1)
+
+        return max(0, min(self.time_per_move_s or float('inf'), self._bank_remaining_s / remaining_moves))
+
     def _load(self, net_version: int = None, filename: str = None):
         if net_version == -1:
-            self.net = Zero._net
+            self.net = Zero.main_net()
         else:
             self.net = CNN().to(device)
             if net_version is not None:
@@ -76,29 +262,109 @@ class Zero(Agent):
 
     @staticmethod
     def save(version: int = None, filename: str = None):
-        Zero._net.save(net_version=version, filename=filename)
+        Zero.main_net().save(net_version=version, filename=filename)
 
     @staticmethod
     def load(version: int = None, filename: str = None):
-        Zero._net.load(net_version=version, filename=filename)
-        Zero._net.set_optimizer()
+        net = Zero.main_net()
+        net.load(net_version=version, filename=filename)
+        net.set_optimizer()
+
+    @staticmethod
+    def distill(train_set=None, num_epochs: int = None):
+        """
+        Train (or keep training) the student to match the current net on train_set, by default the replay buffer
+        """
+        if train_set is None:
+            if len(Zero.replay()) == 0:
+                raise Exception('Nothing to distill on. Pass a train_set, or cook samples with to_replay=True first')
+
+            batch_size = config['ai']['zero']['student']['batch_size']
+            train_set = lambda: Zero.replay().batches(batch_size)
+
+        if Zero._student is None:
+            Zero._student = make_student()
+
+        distill(Zero.main_net(), Zero._student, train_set, num_epochs)
 
     @staticmethod
-    def cook_samples(winner: Player, file_num: int):
-        Zero.cooked_samples = [(
-            sample[0],
-            torch.as_tensor(sample[1], dtype=torch.float, device=device),
-            torch.as_tensor(1 if sample[2] == winner else -1, dtype=torch.short, device=device)
-        ) for sample in Zero.raw_samples]
+    def save_student(version: int = None, filename: str = None):
+        filename = filename or CNN.get_path(version).replace('.pt', '_student.pt')
+        Zero._student.save(filename=filename)
+
+    @staticmethod
+    def load_student(version: int = None, filename: str = None):
+        filename = filename or CNN.get_path(version).replace('.pt', '_student.pt')
+        Zero._student = make_student()
+        Zero._student.load(filename=filename)
+
+    @staticmethod
+    def cook_samples(winner: Player, file_num: int, to_replay: bool = False):
+        """
+        Write out the game's samples. to_replay also keeps them in the replay buffer, for Zero.train to draw from
+        """
+        values = [1 if sample[2] == winner else -1 for sample in Zero.raw_samples]
+        Zero.cooked_samples = [encode(sample[0], sample[1], v) for sample, v in zip(Zero.raw_samples, values)]
+
+        sample_format = config['ai']['zero']['samples']['format']
+        if sample_format == 'records':
+            # The game itself, to be replayed when it's time to train. The sample's player is in the real game
+            if Zero.raw_samples:
+                game = Zero.raw_samples[0][2].game
+                Zero.record_writer().add(game, [(sample[3], sample[1], v) for sample, v in zip(Zero.raw_samples, values)])
+        elif sample_format == 'shards':
+            Zero.shard_writer().add(Zero.cooked_samples, file_num)
+        else:
+            torch.save(Zero.cooked_samples, config['directories']['samples']['save_to'] + '_' + str(file_num))
         Zero.raw_samples = []
-        torch.save(Zero.cooked_samples, config['directories']['samples']['save_to'] + '_' + str(file_num))
+
+        if to_replay:
+            Zero.replay().add(Zero.cooked_samples)
+
+    @staticmethod
+    def shard_writer():
+        if Zero._shard_writer is None:
+            Zero._shard_writer = ShardWriter(config['directories']['samples']['save_to'])
+
+        return Zero._shard_writer
+
+    @staticmethod
+    def record_writer():
+        if Zero._record_writer is None:
+            Zero._record_writer = RecordWriter(config['directories']['samples']['save_to'])
+
+        return Zero._record_writer
+
+    @staticmethod
+    def flush_samples():
+        # Shards fill up over many games. Whatever is left over has to be written out at the end
+        if Zero._shard_writer is not None:
+            Zero._shard_writer.flush()
+
+    @staticmethod
+    def main_net():
+        # Made on first use, not on import. Anything that forks processes to use the GPU (see server.py)
+        # has to do so before this process touches CUDA, or the children can't
+        if Zero._net is None:
+            Zero._net = CNN().to(device)
+
+        return Zero._net
+
+    @staticmethod
+    def replay():
+        # Made on first use - only cook_samples(to_replay=True) and train without a train_set use it,
+        # so sampling processes never allocate one
+        if Zero._replay is None:
+            Zero._replay = ReplayBuffer()
+
+        return Zero._replay
 
     @staticmethod
     def pretrain():
         train_dir = config['directories']['samples']['load_from'] + 'Train/'
         dev_dir = config['directories']['samples']['load_from'] + 'Dev/'
 
-        train_set = CatanDataLoader(train_dir)
+        train_set = CatanDataLoader(train_dir, augment=True)
         dev_set = CatanDataLoader(dev_dir)
 
         start = timeit.default_timer()
@@ -109,7 +375,10 @@ class Zero(Agent):
 
     @staticmethod
     def train(train_set=None, dev_set=None, test_set=None):
-        train_set = train_set or Zero.cooked_samples
+        if train_set is None and len(Zero.replay()) == 0:
+            raise Exception('Nothing to train on. Pass a train_set, or cook samples with to_replay=True first')
+
+        net = Zero.main_net()
         print_every_this_many_samples = 100000
         print_loss_frequency = print_every_this_many_samples / config['ai']['batch_size']
 
@@ -118,17 +387,21 @@ class Zero(Agent):
             start = timeit.default_timer()
             epoch_loss = 0.0
             running_loss = 0.0
-            for i, sample in enumerate(train_set):
-                game_state, pi_target, v_target = sample
+
+            # Self-play training draws fresh minibatches from the replay buffer every epoch
+            epoch_set = train_set if train_set is not None else Zero.replay().batches()
+            for i, sample in enumerate(epoch_set):
+                # Loaders hand back CPU tensors
+                game_state, pi_target, v_target = (t.to(device, non_blocking=True) for t in sample)
 
                 # zero the parameter gradients
-                Zero._net.optimizer.zero_grad()
+                net.optimizer.zero_grad()
 
                 # forward + backward + optimize
-                pi_out, v_out = Zero._net(game_state)
-                loss = Zero._net.criterion(pi_out, pi_target, v_out, v_target)
+                pi_out, v_out = net(game_state)
+                loss = net.criterion(pi_out, pi_target, v_out, v_target)
                 loss.backward()
-                Zero._net.optimizer.step()
+                net.optimizer.step()
 
                 # print statistics
                 epoch_loss += loss.item()
@@ -137,11 +410,11 @@ class Zero(Agent):
                     log.info(f'[{epoch + 1}, {(i+1) * config["ai"]["batch_size"]}] loss: {running_loss / print_every_this_many_samples}', tags=['experiment'])
                     running_loss = 0.0
 
-            Zero._net.scheduler.step()
+            net.scheduler.step()
             end = timeit.default_timer()
             train_stats = {
                 'duration': end - start,
-                'epoch_loss': epoch_loss/(i * config['ai']['batch_size'])
+                'epoch_loss': epoch_loss/((i + 1) * config['ai']['batch_size'])
             }
             log.info(f'epoch finished', data=train_stats, tags=['experiment'])
 
@@ -151,11 +424,11 @@ class Zero(Agent):
                 dev_loss = 0.0
                 with torch.no_grad():
                     for i, sample in enumerate(dev_set):
-                        game_state, pi_target, v_target = sample
+                        game_state, pi_target, v_target = (t.to(device, non_blocking=True) for t in sample)
 
                         # forward
-                        pi_out, v_out = Zero._net(game_state)
-                        loss = Zero._net.criterion(pi_out, pi_target, v_out, v_target)
+                        pi_out, v_out = net(game_state)
+                        loss = net.criterion(pi_out, pi_target, v_out, v_target)
 
                         # record statistics
                         dev_loss += loss.item()
@@ -167,5 +440,7 @@ class Zero(Agent):
                 }
                 log.info(f'dev finished', data=train_stats, tags=['experiment'])
 
-        log.info('Regularization', data=Zero._net.criterion.regularizer.tolist())
+        net.version += 1
+
+        log.info('Regularization', data=net.criterion.regularizer.tolist())
         Zero.cooked_samples = []
@@ -31,11 +31,19 @@ def action(func):
             tags=['actions']
         )
 
+        # Only the real game keeps a record, so it can be played over again later
+        action_id = get_action_id(player.game, func.__name__, args[1:]) if player.game.depth == 0 else None
+
         func(*args, **kwargs)
 
+        player.game.version += 1
+        if action_id is not None:
+            player.game.actions.append(action_id)
+
         player.game.draw()
 
-        if not player.is_cpu:
+        # Copies of a game (e.g. in a search tree) are driven by whoever made them, not by the turn loop
+        if not player.is_cpu and player.game.depth == 0:
             player.game.turn_loop()
 
     return action_wrapper
@@ -222,3 +230,33 @@ def get_action_by_id(game, action_id):
         args = trade_id_to_pair(trade_id)
 
     return func, args, kwargs
+
+
+def get_action_id(game, name, args):
+    """
+    The opposite of get_action_by_id - which id an action function, called with these args, corresponds to
+    """
+    play_development_card_start = 3
+    road_start = play_development_card_start + 4
+    settlement_start = road_start + len(game.board.axial_lanes)
+    city_start = settlement_start + len(game.board.axial_points)
+    trade_start = city_start + len(game.board.axial_points)
+
+    if name == 'roll':
+        return 0
+    elif name == 'end_turn':
+        return 1
+    elif name == 'buy_development_card':
+        return 2
+    elif name == 'play_development_card':
+        return play_development_card_start + args[0]
+    elif name == 'build':
+        piece_type, location = args
+        if piece_type == Road:
+            return road_start + game.board.lanes.index(location)
+        elif piece_type == Settlement:
+            return settlement_start + game.board.points.index(location)
+        else:
+            return city_start + game.board.points.index(location)
+    else:
+        return trade_start + trade_pair_to_id(args)
@@ -5,7 +5,6 @@ Class containing information about the layout of the Catan Board
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from math import ceil, floor, sqrt
-from random import shuffle
 
 import typing
 if typing.TYPE_CHECKING:
@@ -178,6 +177,7 @@ class Hex(BoardPart):
 class Lane(BoardPart):
     def __init__(self, board, points):
         self.board = board
+        self.id = None  # Its index in board.lanes
 
         self.piece = None
 
@@ -272,6 +272,7 @@ class Point(BoardPart):
         self.board = board
         self.q = q
         self.r = r
+        self.id = None  # Its index in board.points
 
         self.lanes = []
         self.hexes = []
@@ -392,8 +393,8 @@ class Board:
         number_tokens = HexNumbers.copy()
 
         if random:
-            shuffle(resource_tiles)
-            shuffle(number_tokens)
+            self.game.rng.shuffle(resource_tiles)
+            self.game.rng.shuffle(number_tokens)
 
         for r in range(self.width):
             for q in range(self.width):
@@ -405,6 +406,7 @@ class Board:
     def assert_point(self, q, r):
         if (q, r) not in self.axial_points:
             point = Point(self, q, r)
+            point.id = len(self.points)
             self.axial_points[(q, r)] = point
             self.points.append(point)
         return self.axial_points[(q, r)]
@@ -423,6 +425,7 @@ class Board:
             p1 = self.axial_points[(q1, r1)]
             p2 = self.axial_points[(q2, r2)]
             lane = Lane(self, [p1, p2])
+            lane.id = len(self.lanes)
             p1.lanes.append(lane)
             p2.lanes.append(lane)
             self.axial_lanes[((q1, r1), (q2, r2))] = lane
@@ -3,7 +3,7 @@ Game logic
 """
 
 from copy import copy
-from random import randint, seed, shuffle
+from random import Random, randrange, seed
 from tkinter import Canvas
 from time import sleep, time
 
@@ -16,6 +16,10 @@ from catan2.constants import DICE_WIDTH, END_TURN_X, END_TURN_Y, ROLL_X, ROLL_Y
 from catan2.catan.development_card import development_cards
 
 
+# Where copies of a game get their randomness
+search_rng = Random()
+
+
 # Generator that answers the question "whose turn is it anyway?"
 def player_loop(players):
     i = 0
@@ -40,32 +44,45 @@ def player_loop(players):
         yield players[i]
 
 
-def shuffle_players(players):
-    shuffle(players)
+def shuffle_players(players, rng: Random):
+    rng.shuffle(players)
     for i, player in enumerate(players):
         player.num = i
 
 
 class Game:
-    def __init__(self, agents: [Agent] = None, is_random: bool = False, canvas: Canvas = None, turn_delay_s: float = None):
+    def __init__(self, agents: [Agent] = None, is_random: bool = False, canvas: Canvas = None, turn_delay_s: float = None,
+                 game_seed: int = None):
         if agents is None:
             return
 
         if config['game']['seed']:
             seed(config['game']['seed'])
 
+        # All of the game's own randomness - board, deck, seating, dice - comes from this one seed,
+        # so the seed plus the actions taken are enough to play the game over again
+        self.seed = game_seed if game_seed is not None else config['game']['seed'] or randrange(2 ** 32)
+        self.rng = Random(self.seed)
+        self.is_random = is_random
+        self.actions = []
+
+        # Bumped by every action, so whoever caches something about the position knows when it's stale
+        self.version = 0
+        self.features = None  # An encoder's buffers for this game, if one has looked at it
+
         self.board = Board(self, is_random)
         self.depth = 0
         self.development_card_deck = copy(development_cards)
-        shuffle(self.development_card_deck)
+        self.rng.shuffle(self.development_card_deck)
         self.last_roll = (None, None)
         self.turn_num = 0
         self.winner = None
+        self.resigned = None
         self._current_player_num = 0
 
         if agents:
             self.players = [Player(self, agent) for agent in agents]
-            shuffle_players(self.players)
+            shuffle_players(self.players, self.rng)
 
             self.player_loop = player_loop(self.players)
             self.current_player = next(self.player_loop)
@@ -99,6 +116,18 @@ class Game:
                 sleep(self.turn_delay_s)
             self.current_player.choose_and_do_action()
 
+        # A human is up. The bots can think in the meantime
+        if not self.is_finished:
+            for player in self.players:
+                if player.is_cpu:
+                    player.agent.ponder()
+
+        # Either the bots or a human just ended it. Anything still thinking can stop
+        else:
+            for player in self.players:
+                if player.is_cpu:
+                    player.agent.game_over()
+
     def is_setup_phase(self):
         return self.turn_num < len(self.players) * 2
 
@@ -108,6 +137,9 @@ class Game:
 
     @property
     def is_finished(self):
+        if self.resigned is not None:
+            return True
+
         for player in self.players:
             if player.victory_points >= config['game']['victory_points_to_win']:
                 return True
@@ -126,9 +158,14 @@ class Game:
 
         return True
 
-    def roll(self):
-        d1 = randint(1, 6)
-        d2 = randint(1, 6)
+    def roll(self, total: int = None):
+        if total is None:
+            d1 = self.rng.randint(1, 6)
+            d2 = self.rng.randint(1, 6)
+        else:
+            # Someone else (e.g. a search tree) decided how this roll turns out
+            d1 = self.rng.randint(max(1, total - 6), min(6, total - 1))
+            d2 = total - d1
         self.last_roll = (d1, d2)
 
         self.board.give_resources(d1 + d2)
@@ -243,7 +280,7 @@ class Game:
 
         return '\n\n' \
                'Game Stats \n\n' \
-               f"| Winner: {self.current_player.name}\n" \
+               f"| Winner: {self.winner.name}\n" \
                f"| Time: {time_string}\n" \
                f"| Turns: {self.turn_num}"
 
@@ -254,8 +291,14 @@ class Game:
 
         return player_recap
 
+    def resign(self, player: Player):
+        self.resigned = player
+
     def finish(self):
-        self.winner = self.current_player
+        if self.resigned is None:
+            self.winner = self.current_player
+        else:
+            self.winner = max((p for p in self.players if p is not self.resigned), key=lambda p: p.victory_points)
         self.draw()
 
         log.info('Game Over', data=self.to_dict(), tags=['game'])
@@ -265,6 +308,7 @@ class Game:
             'duration_seconds': "{:.4f}".format(self.duration) + 's',
             'num_turns': self.turn_num,
             'winner': self.winner.name,
+            'resigned': self.resigned.name if self.resigned is not None else None,
             'players': [player.to_dict() for player in self.players]
         }
 
@@ -272,6 +316,9 @@ class Game:
         game = Game()
         game.depth = self.depth + 1
 
+        # Copies roll whatever a search needs them to, without disturbing the real game's dice
+        game.rng = search_rng
+
         # Create an identical empty board
         game.board = self.board.copy(game)
 
@@ -288,7 +335,11 @@ class Game:
 
         game.turn_num = self.turn_num
         game.last_roll = self.last_roll
+        game.resigned = None
 
         game.development_card_deck = copy(self.development_card_deck)
 
+        game.version = self.version
+        game.features = self.features.copy() if self.features is not None else None
+
         return game
@@ -137,11 +137,11 @@ class Player:
         self.game.end_turn()
 
     @action
-    def roll(self):
+    def roll(self, total=None):
         if not self.game.can_roll():
             raise Exception(f'ERROR {self.name} cannot roll')
 
-        self.game.roll()
+        self.game.roll(total)
 
     @action
     def trade(self, give_resource, receive_resource):
@@ -158,14 +158,20 @@ class Player:
             self.place_piece(piece_type, location)
 
     @action
-    def buy_development_card(self):
+    def buy_development_card(self, card=None):
         if not self.can_afford_development_card():
             raise Exception(f'ERROR {self.name} cannot afford a development card')
 
         for i in range(5):
             self.resource_cards[i] -= DevelopmentCard.cost[i]
 
-        self.development_cards[self.game.development_card_deck.pop()] += 1
+        if card is None:
+            card = self.game.development_card_deck.pop()
+        else:
+            # Someone else (e.g. a search tree) decided which card gets drawn
+            self.game.development_card_deck.remove(card)
+
+        self.development_cards[card] += 1
 
     @action
     def play_development_card(self, i):
@@ -189,6 +195,9 @@ class Player:
         # func, args, kwargs = self.agent.choose_action()
         # func(*args, **kwargs)
 
+    def resign(self):
+        self.game.resign(self)
+
     def can_afford_development_card(self):
         for i in range(5):
             if self.resource_cards[i] < DevelopmentCard.cost[i]:
@@ -0,0 +1,66 @@
+"""
+Distillation Check
+
+Distill a student from the current net, then see how much faster it searches and how it fares against its teacher.
+Run from the repo root: python -m catan2.experiment.distillation <sample_dir> [model_file] [num_games]
+"""
+
+import sys
+
+from catan2 import config, log
+from catan2.agents import Zero
+from catan2.agents.zero.data import CatanDataLoader
+from catan2.experiment.vs import vs, win_ratio
+
+
+def track_nodes_per_s(zero: Zero):
+    """
+    Wrap zero.choose_action to add up the nodes its searches expand, and how long they take
+    """
+    totals = {'nodes': 0, 'seconds': 0.0}
+    choose_action = zero.choose_action
+
+    def tracked_choose_action():
+        action = choose_action()
+        totals['nodes'] += zero.mct.stats.expansions
+        totals['seconds'] += zero.mct.stats.duration or 0
+        return action
+
+    zero.choose_action = tracked_choose_action
+    return totals
+
+
+def check_distillation(sample_dir: str, model_file: str = None, num_games: int = 10):
+    if model_file:
+        Zero.load(filename=model_file)
+
+    Zero.distill(CatanDataLoader(sample_dir, batch_size=config['ai']['zero']['student']['batch_size']))
+
+    student = Zero('Zero', student=True)
+    teacher = Zero('Teacher', net_version=-1)
+    totals = {agent.name: track_nodes_per_s(agent) for agent in (student, teacher)}
+
+    game_results = vs([student, teacher], num_games)
+
+    result = {
+        'student': {'channels': Zero._student.channels, 'res_layers': Zero._student.res_layers},
+        'teacher': {'channels': Zero.main_net().channels, 'res_layers': Zero.main_net().res_layers},
+        'student_win_ratio': win_ratio(game_results, student.name),
+        'nodes_per_s': {
+            name: round(total['nodes'] / total['seconds'], 1) if total['seconds'] else 0
+            for name, total in totals.items()
+        }
+    }
+
+    log.info('Distillation check', data=result, tags=['experiment'])
+
+    return result
+
+
+if __name__ == '__main__':
+    log.setup(filename='distillation.log', level='info')
+    print(check_distillation(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else None,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    ))
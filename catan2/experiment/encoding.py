@@ -0,0 +1,147 @@
+"""
+Encoding Benchmark
+
+Encodings/sec of the in-place GameState encoder versus the one it replaced, which built every plane from scratch.
+Positions come from a game between two Simple bots:
+    fresh       every position encoded cold, from its own copy of the game
+    search      copy a position, take one action, encode - what an expansion does
+    repeat      the same position asked about again
+    batch       the search children again, BATCH_SIZE at a time with GameState.batch
+Every encoding is checked against the old one, bit for bit.
+Run from the repo root: python -m catan2.experiment.encoding [num_positions]
+"""
+
+import sys
+import timeit
+
+import numpy as np
+import torch
+
+from catan2 import log
+from catan2.agents import Simple
+from catan2.agents.zero.device import device
+from catan2.agents.zero.gamestate import GameState
+from catan2.catan import Game
+from catan2.catan.actions import get_action_by_id, get_legal_action_ids
+
+BATCH_SIZE = 64
+
+
+def reference_encoding(game):
+    """
+    The encoder as it was, every plane made anew on every call
+    """
+    board = game.board
+    players = GameState.get_player_list_with_current_player_first(game)
+
+    board_tensor = np.zeros((GameState.num_layers['board'], board.width, board.width), dtype=int)
+    for h in board.hexes:
+        if h.resource.id > 4: continue
+        board_tensor[h.resource.id][h.q][h.r] = h.roll_chance
+
+    piece_tensor = np.zeros((GameState.num_layers['pieces'], board.width, board.width), dtype=int)
+    for p, player in enumerate(players):
+        for road in player.roads:
+            for point in road.lane.points:
+                for h in point.hexes:
+                    piece_tensor[p*3][h.q][h.r] = 1
+        for settlement in player.settlements:
+            for h in settlement.point.hexes:
+                piece_tensor[p*3 + 1][h.q][h.r] = 1
+        for city in player.cities:
+            for h in city.point.hexes:
+                piece_tensor[p*3 + 1][h.q][h.r] = 1
+
+    resource_card_tensor = np.zeros((GameState.num_layers['resource_cards'], board.width, board.width), dtype=int)
+    for p, player in enumerate(players):
+        for i, amt in enumerate(player.resource_cards):
+            resource_card_tensor[(p*5 + i), :, :] = amt
+
+    development_card_tensor = np.zeros((GameState.num_layers['development_cards'], board.width, board.width), dtype=int)
+    for p, player in enumerate(players):
+        for d, amt in enumerate(player.development_cards):
+            development_card_tensor[(p * 5 + d), :, :] = amt
+
+    return torch.as_tensor(np.concatenate((
+        board_tensor,
+        piece_tensor,
+        resource_card_tensor,
+        development_card_tensor
+    ), axis=0), device=device)
+
+
+def play_positions(num_positions: int):
+    """
+    Copies of a game at evenly spaced points along the way
+    """
+    game = Game([Simple('One'), Simple('Two')])
+    positions = []
+    while not game.is_finished:
+        positions.append(game.copy())
+        game.current_player.choose_and_do_action()
+
+    step = max(1, len(positions) // num_positions)
+    return positions[::step][:num_positions]
+
+
+def encodings_per_s(encode, games):
+    start = timeit.default_timer()
+    for game in games:
+        encode(game)
+
+    return len(games) / (timeit.default_timer() - start)
+
+
+def batch_encodings_per_s(games, batch_size: int = BATCH_SIZE):
+    out = GameState.empty(batch_size)
+
+    start = timeit.default_timer()
+    for i in range(0, len(games), batch_size):
+        GameState.batch(games[i:i + batch_size], out)
+
+    return len(games) / (timeit.default_timer() - start)
+
+
+def benchmark_encoding(num_positions: int = 200):
+    positions = play_positions(num_positions)
+    fresh = [game.copy() for game in positions]
+    reference_per_s = encodings_per_s(reference_encoding, positions)
+    fresh_per_s = encodings_per_s(GameState, fresh)
+
+    for game in fresh:
+        if not torch.equal(GameState(game).tensor, reference_encoding(game)):
+            raise Exception('The in-place encoding does not match the old one')
+
+    # A child of each position, one action on, the way the search makes them
+    children = []
+    for game in fresh:
+        legal_action_ids = get_legal_action_ids(game)
+        if legal_action_ids:
+            child = game.copy()
+            func, args, kwargs = get_action_by_id(child, legal_action_ids[-1])
+            func(*args, **kwargs)
+            children.append(child)
+
+    results = {
+        'positions': len(positions),
+        'reference_per_s': round(reference_per_s, 1),
+        'fresh_per_s': round(fresh_per_s, 1),
+        'search_per_s': round(encodings_per_s(GameState, children), 1),
+        'repeat_per_s': round(encodings_per_s(GameState, fresh), 1),
+        'batch_per_s': round(batch_encodings_per_s(children), 1)
+    }
+
+    for game in children:
+        if not torch.equal(GameState(game).tensor, reference_encoding(game)):
+            raise Exception('The in-place encoding does not match the old one after a move')
+    if not torch.equal(GameState.batch(children), torch.stack([reference_encoding(game) for game in children])):
+        raise Exception('The batched encoding does not match the old one')
+
+    log.info('Encoding benchmark', data=results, tags=['experiment'])
+
+    return results
+
+
+if __name__ == '__main__':
+    log.setup(filename='encoding.log', level='info')
+    print(benchmark_encoding(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,55 @@
+"""
+Evaluator Benchmark
+
+How fast Zero decides, and how often it beats Simple, with each kind of leaf evaluator.
+Run from the repo root: python -m catan2.experiment.evaluators [num_games]
+"""
+
+import sys
+import timeit
+
+from catan2 import config, log
+from catan2.agents import Simple, Zero
+from catan2.experiment.vs import vs, win_ratio
+
+EVALUATORS = ['net', 'heuristic', 'rollout']
+
+
+def benchmark_evaluator(kind: str, num_games: int):
+    zero = Zero(f'Zero-{kind}', net_version=-1, evaluator=kind)
+
+    decisions = 0
+    seconds = 0
+    choose_action = zero.choose_action
+
+    def timed_choose_action():
+        nonlocal decisions, seconds
+        start = timeit.default_timer()
+        action = choose_action()
+        seconds += timeit.default_timer() - start
+        decisions += 1
+        return action
+
+    zero.choose_action = timed_choose_action
+    game_results = vs([zero, Simple()], num_games)
+
+    return {
+        'evaluator': kind,
+        'iterations': config['ai']['zero']['mcts']['iterations'],
+        'decisions': decisions,
+        'decisions_per_s': round(decisions / seconds, 2) if seconds else 0,
+        'win_ratio_vs_simple': win_ratio(game_results, zero.name)
+    }
+
+
+def benchmark_evaluators(num_games: int = 10, kinds: [str] = None):
+    results = [benchmark_evaluator(kind, num_games) for kind in kinds or EVALUATORS]
+    log.info('Evaluator benchmark', data=results, tags=['experiment'])
+
+    return results
+
+
+if __name__ == '__main__':
+    log.setup(filename='evaluators.log', level='info')
+    for result in benchmark_evaluators(int(sys.argv[1]) if len(sys.argv) > 1 else 10):
+        print(result)
@@ -0,0 +1,86 @@
+"""
+Inference Benchmark
+
+Latency of one forward, single state and batched, thru the CNN as search used to call it versus the compiled copy,
+with the full policy head or just the rows for a typical number of legal moves.
+Run from the repo root: python -m catan2.experiment.inference [num_reps]
+"""
+
+import copy
+import sys
+import timeit
+
+import torch
+
+from catan2 import log
+from catan2.agents.zero.cnn import CNN, NUM_GAME_LAYERS
+from catan2.agents.zero.compiled import CompiledNet
+from catan2.constants import BOARD_WIDTH, NUM_UNIQUE_ACTIONS
+
+BATCH_SIZES = [1, 8, 64]
+NUM_LEGAL_ACTIONS = 30
+
+
+def random_states(batch_size):
+    return torch.randint(0, 3, (batch_size, NUM_GAME_LAYERS, BOARD_WIDTH, BOARD_WIDTH))
+
+
+def random_legal_action_ids(batch_size):
+    return [sorted(torch.randperm(NUM_UNIQUE_ACTIONS)[:NUM_LEGAL_ACTIONS].tolist()) for _ in range(batch_size)]
+
+
+def latency_ms(model, states, num_reps):
+    with torch.no_grad():
+        model(states)  # warm up
+        start = timeit.default_timer()
+        for _ in range(num_reps):
+            model(states)
+
+    return (timeit.default_timer() - start) / num_reps * 1000
+
+
+def benchmark_inference(num_reps: int = 200, batch_sizes: [int] = None):
+    net = CNN()
+    compiled = CompiledNet(net, sparse_policy=False)
+    sparse = CompiledNet(net, sparse_policy=True)
+
+    results = []
+    for batch_size in batch_sizes or BATCH_SIZES:
+        states = random_states(batch_size)
+
+        # Search ran single states in training mode, and batches in eval mode
+        # Training mode forwards update the BatchNorm running stats, so time a copy
+        current_net = copy.deepcopy(net).train(batch_size == 1)
+        current = latency_ms(current_net, states, num_reps)
+
+        with torch.no_grad():
+            p, v = net.eval()(states)
+        p_compiled, v_compiled = compiled(states)
+
+        # Sparse priors are normalized over the legal moves only
+        legal_action_ids = random_legal_action_ids(batch_size)
+        p_sparse, _ = sparse.legal_priors(states, legal_action_ids)
+        sparse_error = max(
+            float((p_sparse[i] - p[i][legal] / p[i][legal].sum()).abs().max())
+            for i, legal in enumerate(legal_action_ids)
+        )
+
+        results.append({
+            'batch_size': batch_size,
+            'current_ms': round(current, 3),
+            # Both compiled nets are timed the way search calls them, ending with the priors of the legal moves
+            'compiled_ms': round(latency_ms(lambda s: compiled.legal_priors(s, legal_action_ids), states, num_reps), 3),
+            'compiled_sparse_ms': round(latency_ms(lambda s: sparse.legal_priors(s, legal_action_ids), states, num_reps), 3),
+            'max_abs_error': float(max((p - p_compiled).abs().max(), (v - v_compiled).abs().max())),
+            'sparse_max_abs_error': sparse_error
+        })
+
+    log.info('Inference benchmark', data=results, tags=['experiment'])
+
+    return results
+
+
+if __name__ == '__main__':
+    log.setup(filename='inference.log', level='info')
+    for result in benchmark_inference(int(sys.argv[1]) if len(sys.argv) > 1 else 200):
+        print(result)
@@ -0,0 +1,46 @@
+"""
+Loader Benchmark
+
+Samples/sec thru Zero.train (the work Zero.pretrain does) from a shard directory, with different numbers of loader workers.
+Run from the repo root: python -m catan2.experiment.loader <shard_dir> [num_workers ...]
+"""
+
+import sys
+import timeit
+
+from catan2 import config, log
+from catan2.agents import Zero
+from catan2.agents.zero.data import CatanDataLoader
+
+WORKER_COUNTS = [1, 2, 4]
+
+
+def benchmark_loader(shard_dir: str, worker_counts: [int] = None):
+    num_epochs = config['ai']['num_epochs']
+    config['ai']['num_epochs'] = 1
+
+    results = []
+    for num_workers in worker_counts or WORKER_COUNTS:
+        loader = CatanDataLoader(shard_dir, num_workers=num_workers, augment=True)
+
+        start = timeit.default_timer()
+        Zero.train(loader)
+        duration = timeit.default_timer() - start
+
+        results.append({
+            'num_workers': num_workers,
+            'samples': len(loader.dataset),
+            'duration_s': round(duration, 3),
+            'samples_per_s': round(len(loader.dataset) / duration, 1)
+        })
+
+    config['ai']['num_epochs'] = num_epochs
+    log.info('Loader benchmark', data=results, tags=['experiment'])
+
+    return results
+
+
+if __name__ == '__main__':
+    log.setup(filename='loader.log', level='info')
+    for result in benchmark_loader(sys.argv[1], [int(n) for n in sys.argv[2:]] or None):
+        print(result)
@@ -0,0 +1,79 @@
+"""
+Quantization Check
+
+How far the int8 copy of the net strays from the float net on held-out samples, and how much faster it is.
+Run from the repo root: python -m catan2.experiment.quantization <sample_dir> [model_file]
+"""
+
+import sys
+import timeit
+
+import torch
+
+from catan2 import log
+from catan2.agents.zero.cnn import CNN
+from catan2.agents.zero.compiled import CompiledNet
+from catan2.agents.zero.data import CatanDataLoader
+
+BATCH_SIZES = [1, 64]
+
+
+def load_states(sample_dir: str, max_samples: int):
+    states = []
+    for batch_states, _, _ in CatanDataLoader(sample_dir, batch_size=256):
+        states.append(batch_states)
+        if sum(len(s) for s in states) >= max_samples:
+            break
+
+    return torch.cat(states)[:max_samples]
+
+
+def states_per_s(model, states, batch_size, num_reps):
+    batch = states[:batch_size]
+    model(batch)  # warm up
+
+    start = timeit.default_timer()
+    for _ in range(num_reps):
+        model(batch)
+
+    return len(batch) * num_reps / (timeit.default_timer() - start)
+
+
+def check_quantization(sample_dir: str, model_file: str = None, max_samples: int = 2048, num_reps: int = 100):
+    net = CNN()
+    if model_file:
+        net.load(filename=model_file)
+
+    states = load_states(sample_dir, max_samples)
+    # The dense policy head on both, so the int8 copy's p_fc is quantized and the two are compared like for like
+    float_net = CompiledNet(net, sparse_policy=False)
+    int8_net = CompiledNet(net, quantize=True, sparse_policy=False)
+
+    p_float, v_float = float_net(states)
+    p_int8, v_int8 = int8_net(states)
+
+    kl = (p_float * ((p_float + 1e-8) / (p_int8 + 1e-8)).log()).sum(dim=1)
+    value_error = (v_float - v_int8).abs().view(-1)
+
+    result = {
+        'samples': len(states),
+        'policy_kl_mean': float(kl.mean()),
+        'policy_kl_max': float(kl.max()),
+        'value_abs_error_mean': float(value_error.mean()),
+        'value_abs_error_max': float(value_error.max()),
+        'states_per_s': {
+            batch_size: {
+                'float': round(states_per_s(float_net, states, batch_size, num_reps), 1),
+                'int8': round(states_per_s(int8_net, states, batch_size, num_reps), 1)
+            } for batch_size in BATCH_SIZES
+        }
+    }
+
+    log.info('Quantization check', data=result, tags=['experiment'])
+
+    return result
+
+
+if __name__ == '__main__':
+    log.setup(filename='quantization.log', level='info')
+    print(check_quantization(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,66 @@
+"""
+Sample Size
+
+Bytes per sample, dense vs compact: in memory, torch.save'd the way cook_samples writes a game, as shards on disk,
+and per slot of the replay buffer.
+Run from the repo root: python -m catan2.experiment.sample_size <sample_dir>
+"""
+
+import os
+import sys
+import tempfile
+
+import torch
+
+from catan2 import log
+from catan2.agents.zero.compact import as_compact, decode, nbytes, pickled_nbytes
+from catan2.agents.zero.replay import ReplayBuffer
+from catan2.agents.zero.shards import ShardWriter
+
+
+def dense(sample):
+    """
+    A sample the way it was cooked before compact.py: int64 state, 207 float pi, short value
+    """
+    state, pi, value = decode(sample)
+    return state.cpu(), pi.cpu(), value.cpu()
+
+
+def measure_sample_size(sample_dir: str):
+    samples = [s for f in sorted(os.listdir(sample_dir)) for s in torch.load(os.path.join(sample_dir, f))]
+    dense_samples = [dense(s) for s in samples]
+    compact_samples = [as_compact(s) for s in samples]
+
+    with tempfile.TemporaryDirectory() as shard_dir:
+        writer = ShardWriter(shard_dir, shard_size=len(compact_samples))
+        writer.add(compact_samples, 0)
+        writer.flush()
+        shard_bytes = sum(os.path.getsize(os.path.join(shard_dir, f)) for f in os.listdir(shard_dir))
+
+    replay = ReplayBuffer(capacity=len(compact_samples))
+    replay.add(compact_samples)
+    replay_bytes = nbytes((replay.states, replay.policy_ids, replay.policy_probs, replay.values))
+
+    result = {
+        'samples': len(samples),
+        'memory': {
+            'dense': round(sum(map(nbytes, dense_samples)) / len(samples), 1),
+            'compact': round(sum(map(nbytes, compact_samples)) / len(samples), 1)
+        },
+        'torch_save': {
+            'dense': round(pickled_nbytes(dense_samples), 1),
+            'compact': round(pickled_nbytes(compact_samples), 1)
+        },
+        'shards': round(shard_bytes / len(samples), 1),
+        'replay': round(replay_bytes / len(samples), 1),
+        'replay_truncated': replay.truncated
+    }
+
+    log.info('Sample size', data=result, tags=['experiment'])
+
+    return result
+
+
+if __name__ == '__main__':
+    log.setup(filename='sample_size.log', level='info')
+    print(measure_sample_size(sys.argv[1]))
@@ -0,0 +1,147 @@
+"""
+Search Checks
+
+Searches from mid-game positions of games between two Zeros, checking the tree afterwards:
+    chance      a ChanceNode's q agrees with the values backed up thru it (w / n), including where an outcome
+                hands the turn to the other player - a roll or a draw followed by a forced end_turn
+    visits      every node's n adds up with its children's, after a search squeezed into a small node pool
+                (with batch_children on) has evicted subtrees: an expanded node has 1 + the sum of its children's,
+                a chance node exactly the sum of its children's, and never no children at all
+Raises if a check fails, and logs what was checked.
+Run from the repo root: python -m catan2.experiment.search_checks [num_positions]
+"""
+
+import sys
+
+from catan2 import config, log
+from catan2.agents import Zero
+from catan2.agents.zero.mcts import MCT, ChanceNode
+from catan2.agents.zero.pool import NodePool
+from catan2.catan import Game
+
+ITERATIONS = 300
+
+# Outcomes are visited in proportion to their probabilities, but only roughly, so q and w / n differ a little
+CHANCE_TOLERANCE = 0.1
+CHANCE_MIN_VISITS = 8
+
+# Small enough that every search evicts
+MAX_NODES = 60
+
+
+def mid_game_positions(num_positions: int):
+    """
+    One position per game, a little further into each game than the last
+    """
+    positions = []
+    for k in range(num_positions):
+        game = Game([Zero('One', net_version=-1), Zero('Two', net_version=-1)])
+        while game.is_setup_phase():
+            game.current_player.choose_and_do_action()
+        for _ in range(20 + 15 * k):
+            if game.is_finished:
+                break
+            game.current_player.choose_and_do_action()
+
+        if not game.is_finished:
+            positions.append(game)
+
+    return positions
+
+
+def nodes(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        yield node
+
+
+def check_chance_nodes(root):
+    """
+    (chance nodes, ones where an outcome hands over the turn, ones of those checked)
+    """
+    num_chance, num_handed_over, num_checked = 0, 0, 0
+    for node in nodes(root):
+        if not isinstance(node, ChanceNode) or not node.children:
+            continue
+
+        num_chance += 1
+        if all(child.game.current_player.num == node.game.current_player.num for child in node.children):
+            continue
+
+        num_handed_over += 1
+        if node.n < CHANCE_MIN_VISITS:
+            continue
+
+        num_checked += 1
+        if abs(node.q - node.w / node.n) > CHANCE_TOLERANCE:
+            raise Exception(f'Chance node q {node.q:.3f} disagrees with its backed up value {node.w / node.n:.3f}')
+
+    return num_chance, num_handed_over, num_checked
+
+
+def check_visits(root):
+    """
+    (nodes checked, chance nodes among them)
+    """
+    num_checked, num_chance = 0, 0
+    for node in nodes(root):
+        children_n = sum(child.n for child in node.children)
+        if isinstance(node, ChanceNode):
+            num_chance += 1
+            if not node.children or node.n != children_n:
+                raise Exception(f'Chance node has n {node.n}, but {len(node.children)} children with n {children_n}')
+        elif not node.game.is_finished and node.n != 1 + children_n:
+            raise Exception(f'Node has n {node.n}, but its children have n {children_n}')
+
+        num_checked += 1
+
+    return num_checked, num_chance
+
+
+def check_search(num_positions: int = 3):
+    results = {
+        'positions': 0,
+        'chance_nodes': 0,
+        'chance_handed_over': 0,
+        'chance_checked': 0,
+        'visits_checked': 0,
+        'visits_chance_checked': 0,
+        'evicted_subtrees': 0
+    }
+
+    batch_children = config['ai']['zero']['mcts']['batch_children']['enabled']
+    for game in mid_game_positions(num_positions):
+        config['ai']['zero']['mcts']['batch_children']['enabled'] = False
+        tree = MCT()
+        tree.search(game, Zero.main_net(), ITERATIONS)
+
+        num_chance, num_handed_over, num_checked = check_chance_nodes(tree.root)
+        results['positions'] += 1
+        results['chance_nodes'] += num_chance
+        results['chance_handed_over'] += num_handed_over
+        results['chance_checked'] += num_checked
+
+        config['ai']['zero']['mcts']['batch_children']['enabled'] = True
+        tree = MCT()
+        tree.pool = NodePool(max_nodes=MAX_NODES)
+        tree.search(game, Zero.main_net(), ITERATIONS)
+
+        num_checked, num_chance = check_visits(tree.root)
+        results['visits_checked'] += num_checked
+        results['visits_chance_checked'] += num_chance
+        results['evicted_subtrees'] += tree.pool.evicted
+    config['ai']['zero']['mcts']['batch_children']['enabled'] = batch_children
+
+    if results['chance_checked'] == 0:
+        raise Exception('No chance node that hands over the turn was visited enough to check')
+
+    log.info('Search checks', data=results, tags=['experiment'])
+
+    return results
+
+
+if __name__ == '__main__':
+    log.setup(filename='search_checks.log', level='info')
+    print(check_search(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
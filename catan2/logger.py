@@ -38,6 +38,9 @@ class Logger:
         self.level = LogLevel[level.upper()].value
         logging.basicConfig(filename=filename, level=self.level)
 
+    def is_enabled_for(self, level: str):
+        return self.level <= LogLevel[level.upper()].value
+
     @staticmethod
     def _log(message: str, data: object, tags: [str], log_func: Callable[[str], None]):
         if tags is None or any([config['logging']['categories'][tag] for tag in tags]):
@@ -1,7 +1,9 @@
 from tqdm import tqdm
 
-from catan2 import config
+from catan2 import config, log
 from catan2.agents import Zero
+from catan2.agents.zero.cnn import CNN
+from catan2.agents.zero.server import InferenceClient, InferenceServer, ctx
 from catan2.catan import Game
 
 
@@ -9,10 +11,101 @@ def sample(canvas=None):
     if config['ai']['agent'].lower() != 'zero':
         raise NotImplementedError('Sample only supports Zero')
 
+    num_workers = config['experiment']['num_workers']
+    if num_workers > 1:
+        sample_with_server(num_workers)
+        return
+
     for i in tqdm(range(config['experiment']['num_samples'])):
-        winner = Game(
-            agents=[Zero('ZeroOne'), Zero('ZeroTwo')],
-            canvas=canvas
-        ).start().winner
+        agents = [Zero('ZeroOne', self_play=True), Zero('ZeroTwo', self_play=True)]
+        game = Game(agents=agents, canvas=canvas).start()
+
+        Zero.cook_samples(game.winner, i)
+        log_saved_iterations(agents, i)
+        log_playout_cap(agents, i)
+        log_resignations(agents, game, i)
+
+    Zero.flush_samples()
+
+
+def sample_with_server(num_workers):
+    # Sampling never loads a net, so the server gets fresh weights, made on the CPU. It moves them to the GPU itself.
+    # Nothing here may touch CUDA before the server and the workers are forked, or none of them could use it
+    server = InferenceServer(CNN(), num_workers).start()
+
+    workers = [
+        ctx.Process(target=sample_worker, args=(server.client(worker_id), worker_id, num_workers))
+        for worker_id in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    server.stop()
+
+
+def sample_worker(client: InferenceClient, worker_id: int, num_workers: int):
+    for i in range(worker_id, config['experiment']['num_samples'], num_workers):
+        agents = [Zero('ZeroOne', client=client, self_play=True), Zero('ZeroTwo', client=client, self_play=True)]
+        game = Game(agents=agents).start()
+
+        Zero.cook_samples(game.winner, i)
+        log_saved_iterations(agents, i)
+        log_playout_cap(agents, i)
+        log_resignations(agents, game, i)
+
+    Zero.flush_samples()
+
+
+def log_saved_iterations(agents, game_num):
+    """
+    How much searching early stopping skipped over one game
+    """
+    if not config['ai']['zero']['mcts']['early_stop']['enabled']:
+        return
+
+    saved = [n for agent in agents for n in agent.saved_iterations]
+    budget = config['ai']['zero']['mcts']['iterations'] * len(saved)
+    log.info('Early stopping', data={
+        'game': game_num,
+        'moves': len(saved),
+        'stopped_early': sum(1 for n in saved if n > 0),
+        'saved_iterations': sum(saved),
+        'saved_fraction': sum(saved) / budget if budget else 0
+    }, tags=['experiment'])
+
+
+def log_playout_cap(agents, game_num):
+    """
+    How many moves got the full search (and became samples) over one game
+    """
+    if not config['ai']['zero']['mcts']['playout_cap']['enabled']:
+        return
+
+    full = sum(agent.full_searches for agent in agents)
+    fast = sum(agent.fast_searches for agent in agents)
+    log.info('Playout cap', data={
+        'game': game_num,
+        'full_searches': full,
+        'fast_searches': fast,
+        'samples': full
+    }, tags=['experiment'])
+
+
+def log_resignations(agents, game, game_num):
+    """
+    Whether the game was resigned, and in a played-out game, whether anyone who would have resigned went on to win
+    False resignations over all played-out games are the ones that matter when tuning the threshold
+    """
+    if not config['ai']['zero']['resign']['enabled']:
+        return
 
-        Zero.cook_samples(winner, i)
+    would_have_resigned = [agent.name for agent in agents if agent.would_have_resigned]
+    log.info('Resignation', data={
+        'game': game_num,
+        'turns': game.turn_num,
+        'resigned': game.resigned.name if game.resigned is not None else None,
+        'would_have_resigned': would_have_resigned,
+        'false_resignation': game.winner.name in would_have_resigned
+    }, tags=['experiment'])
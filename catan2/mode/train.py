@@ -7,6 +7,7 @@ from catan2.catan import Game
 from catan2.agents import Random, Simple, Zero
 from catan2.experiment.vs import vs, win_ratio
 from catan2.experiment.plot import plot_results
+from catan2.mode.sample import log_playout_cap, log_resignations, log_saved_iterations
 
 
 def process_results(game_results, plot=True):
@@ -47,14 +48,18 @@ def train(canvas=None, turn_delay_s=None):
     # Run the experiment
     for i in range(config['experiment']['num_sets']):
         for j in tqdm(range(config['experiment']['num_reps'])):
-            game = Game(
-                agents=[agent_class(name='ZeroOne', net_version=-1), agent_class(name='ZeroTwo', net_version=-1)],
-                canvas=canvas,
-                turn_delay_s=turn_delay_s
-            ).start()
-            agent_class.cook_samples(game.winner, i * config['experiment']['num_reps'] + j)
+            agents = [
+                agent_class(name='ZeroOne', net_version=-1, self_play=True),
+                agent_class(name='ZeroTwo', net_version=-1, self_play=True)
+            ]
+            game = Game(agents=agents, canvas=canvas, turn_delay_s=turn_delay_s).start()
+            agent_class.cook_samples(game.winner, i * config['experiment']['num_reps'] + j, to_replay=True)
+            log_saved_iterations(agents, i * config['experiment']['num_reps'] + j)
+            log_playout_cap(agents, i * config['experiment']['num_reps'] + j)
+            log_resignations(agents, game, i * config['experiment']['num_reps'] + j)
 
         log.debug(f'Finished round {i} of episodes', tags=['experiment'])
+        agent_class.flush_samples()
 
         agent_class.save(i)
         agent_class.train()
@@ -50,14 +50,18 @@ config['directories']['samples']['save_to'] = sample_dir
 parser = argparse.ArgumentParser()
 
 parser.add_argument('-a', '--agent', type=str, default='zero', choices=['zero'])
+parser.add_argument('-e', '--evaluator', type=str, choices=['net', 'heuristic', 'rollout'])
 parser.add_argument('-g', '--graphics', action='store_true')
 parser.add_argument('--load_samples', type=str)
 parser.add_argument('--load_model', type=str)
 parser.add_argument('--log_level', type=str, choices=['critical', 'error', 'warn', 'info', 'debug', 'trace'])
 parser.add_argument('--mcts_depth', type=int)
+parser.add_argument('--mcts_time_s', type=float)
+parser.add_argument('--mcts_time_bank_s', type=float)
 parser.add_argument('--mode', type=str, choices=['play', 'sample', 'train'])
 parser.add_argument('--num_epochs', type=int)
 parser.add_argument('--num_samples', type=int)
+parser.add_argument('--num_workers', type=int)
 parser.add_argument('--num_rounds', type=int)
 parser.add_argument('--players', nargs=2, type=str)
 parser.add_argument('--turn_delay_s', type=float)
@@ -66,15 +70,19 @@ parser.add_argument('--turn_delay_s', type=float)
 # Save arguments to config
 args = parser.parse_args()
 
-config['ai']['agent']                      = args.agent or config['ai']['agent']
-config['ai']['num_epochs']                 = args.num_epochs or config['ai']['num_epochs']
-config['ai']['zero']['mcts']['iterations'] = args.mcts_depth if args.mcts_depth is not None else config['ai']['zero']['mcts']['iterations']
-config['experiment']['num_samples']        = args.num_samples or config['experiment']['num_samples']
-config['game']['player_names']             = args.players or config['game']['player_names']
-config['graphics']['display']              = args.graphics or config['graphics']['display']
-config['graphics']['turn_delay_s']         = args.turn_delay_s or config['graphics']['turn_delay_s']
-config['logging']['level']                 = args.log_level or config['logging']['level']
-config['mode']                             = args.mode or config['mode']
+config['ai']['agent']                           = args.agent or config['ai']['agent']
+config['ai']['num_epochs']                      = args.num_epochs or config['ai']['num_epochs']
+config['ai']['zero']['evaluator']['type']       = args.evaluator or config['ai']['zero']['evaluator']['type']
+config['ai']['zero']['mcts']['iterations']      = args.mcts_depth if args.mcts_depth is not None else config['ai']['zero']['mcts']['iterations']
+config['ai']['zero']['mcts']['time_per_move_s'] = args.mcts_time_s or config['ai']['zero']['mcts']['time_per_move_s']
+config['ai']['zero']['mcts']['time_bank_s']     = args.mcts_time_bank_s or config['ai']['zero']['mcts']['time_bank_s']
+config['experiment']['num_samples']             = args.num_samples or config['experiment']['num_samples']
+config['experiment']['num_workers']             = args.num_workers or config['experiment']['num_workers']
+config['game']['player_names']                  = args.players or config['game']['player_names']
+config['graphics']['display']                   = args.graphics or config['graphics']['display']
+config['graphics']['turn_delay_s']              = args.turn_delay_s or config['graphics']['turn_delay_s']
+config['logging']['level']                      = args.log_level or config['logging']['level']
+config['mode']                                  = args.mode or config['mode']
 
 config['directories']['samples']['load_from'] = 'D:/Catan2/samples/' + args.load_samples + '/' if args.load_samples else ''
 config['directories']['model']['load_from']   = 'D:/Catan2/models/' + args.load_model + '.pt' if args.load_model else ''